@@ -0,0 +1,107 @@
+"""
+Benchmarks for order_exec_v11 helpers (order_exec_v11_ibind shares the same code).
+
+Run from the repository root:
+    python benchmarks/bench_order_exec.py [baseline_rev]
+
+Both benchmarks call the real functions from order_exec_v11. The date-parsing
+"before" numbers come from standardize_date_format as it was at baseline_rev
+(default: the first commit), loaded from git rather than re-implemented.
+"""
+import ast
+import datetime
+import os
+import random
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import order_exec_v11 as oe
+
+
+def load_function_at_revision(rev, path, name):
+    """Compile function `name` from `path` as of git revision `rev`, resolving globals in order_exec_v11"""
+    source = subprocess.check_output(['git', 'show', f'{rev}:{path}'], cwd=REPO_ROOT, text=True)
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            namespace = dict(vars(oe))
+            exec(ast.get_source_segment(source, node), namespace)
+            return namespace[name]
+    raise LookupError(f"{name} not found in {path} at {rev}")
+
+
+def first_commit():
+    return subprocess.check_output(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=REPO_ROOT, text=True).split()[0]
+
+
+def benchmark_standardize_date_format(baseline_rev, iterations=20000):
+    """Per-call cost of standardize_date_format at baseline_rev vs the current memoized version"""
+    samples = ['2024-03-07', '2024-3-7', '3/7/2024', '12/31/2023', 'March 7, 2024']
+    baseline = load_function_at_revision(baseline_rev, 'order_exec_v11.py', 'standardize_date_format')
+
+    def time_per_call(func, count):
+        start = time.perf_counter()
+        for i in range(count):
+            func(samples[i % len(samples)])
+        return (time.perf_counter() - start) / count * 1e6
+
+    oe._standardize_date_cached.cache_clear()
+    before = time_per_call(baseline, max(iterations // 10, len(samples)))
+    after = time_per_call(oe.standardize_date_format, iterations)
+    print(f"standardize_date_format: {before:.2f} us/call at {baseline_rev[:7]} -> {after:.2f} us/call now "
+          f"({oe._standardize_date_cached.cache_info()})")
+    return before, after
+
+
+def benchmark_trade_queries(years=5, tickers=100, lookups=200):
+    """Synthetic multi-year trades table; query plans/timings before and after DatabaseHandler's migrations"""
+    handler = oe.DatabaseHandler(':memory:', migrate=False)
+    symbols = [f"T{i:03d}" for i in range(tickers)]
+    start = datetime.date.today() - datetime.timedelta(days=365 * years)
+    dates = [d for d in (start + datetime.timedelta(days=i) for i in range(365 * years)) if d.weekday() < 5]
+    dates = [d.strftime("%Y-%m-%d") for d in dates]
+
+    with handler.lock:
+        handler.conn.executemany(
+            "INSERT INTO trades (date, ticker, net_units, trade_price) VALUES (?, ?, ?, ?)",
+            ((date, symbol, random.randint(-100, 100), random.uniform(10, 500)) for date in dates for symbol in symbols)
+        )
+        handler.conn.executemany(
+            "INSERT INTO strategy_cash (strategy_idx, date, cash) VALUES (?, ?, ?)",
+            ((strategy_idx, date, 100000.0) for strategy_idx in range(3) for date in dates)
+        )
+        handler.conn.commit()
+    print(f"Synthetic trades table: {len(dates) * len(symbols)} rows over {len(dates)} trading days")
+
+    queries = {
+        'export_to_sheet': ("SELECT * FROM trades WHERE date = ? ORDER BY id DESC", lambda: (random.choice(dates),)),
+        'ticker_history': ("SELECT date, net_units, trade_price FROM trades WHERE ticker = ? ORDER BY date",
+                           lambda: (random.choice(symbols),)),
+        'previous_day_cash': ("SELECT cash FROM strategy_cash WHERE strategy_idx = ? ORDER BY date DESC LIMIT 1",
+                              lambda: (random.randrange(3),)),
+    }
+
+    def measure(label):
+        timings = {}
+        for name, (sql, make_params) in queries.items():
+            plan = handler.conn.execute("EXPLAIN QUERY PLAN " + sql, make_params()).fetchall()
+            start_time = time.perf_counter()
+            for _ in range(lookups):
+                handler.conn.execute(sql, make_params()).fetchall()
+            timings[name] = (time.perf_counter() - start_time) / lookups * 1e3
+            print(f"[{label}] {name}: {timings[name]:.3f} ms/query | " + "; ".join(row[-1] for row in plan))
+        return timings
+
+    before = measure("before")
+    handler.apply_migrations()
+    after = measure("after")
+    handler.close()
+    return before, after
+
+
+if __name__ == "__main__":
+    benchmark_standardize_date_format(sys.argv[1] if len(sys.argv) > 1 else first_commit())
+    benchmark_trade_queries()
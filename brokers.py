@@ -0,0 +1,306 @@
+"""
+Execution backends shared by order_exec_v11.py (TWS) and order_exec_v11_ibind.py (Web API):
+the Broker interface, the offline SimulatedBroker, and the fill bookkeeping every broker uses.
+"""
+import time
+import datetime
+import threading
+import asyncio
+from abc import ABC, abstractmethod
+
+
+# Signals per order_id once an order reaches a terminal status and every fill has its commission report
+class OrderCompletionTracker:
+    TERMINAL_STATUSES = {'Filled', 'Cancelled', 'ApiCancelled', 'Inactive'}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = {}          # order_id -> threading.Event
+        self.statuses = {}        # order_id -> last status
+        self.quantities = {}      # order_id -> ordered quantity (if known)
+        self.exec_ids = {}        # order_id -> set of execIds seen
+        self.exec_shares = {}     # order_id -> shares executed so far
+        self.exec_orders = {}     # execId -> order_id
+        self.commissions = set()  # execIds with a commission report
+        self.async_waiters = {}   # order_id -> [(loop, asyncio.Future)]
+
+    def register(self, order_id, quantity=None):
+        with self.lock:
+            if quantity is not None:
+                self.quantities[order_id] = quantity
+            return self.events.setdefault(order_id, threading.Event())
+
+    def _check(self, order_id):
+        # Called with the lock held
+        status = self.statuses.get(order_id)
+        if status not in self.TERMINAL_STATUSES:
+            return
+        if status == 'Filled':
+            # orderStatus can arrive before execDetails; wait for every fill and its commission
+            exec_ids = self.exec_ids.get(order_id, set())
+            if not exec_ids or not exec_ids <= self.commissions:
+                return
+            quantity = self.quantities.get(order_id)
+            if quantity is not None and self.exec_shares.get(order_id, 0) < quantity:
+                return
+        self.events.setdefault(order_id, threading.Event()).set()
+        for loop, future in self.async_waiters.pop(order_id, []):
+            # The waiter's loop may already be gone (asyncio.run returned); never raise on the callback thread
+            if loop.is_closed():
+                continue
+            try:
+                loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(order_id))
+            except RuntimeError:
+                pass
+
+    def update_status(self, order_id, status):
+        with self.lock:
+            self.statuses[order_id] = status
+            self._check(order_id)
+
+    def record_execution(self, order_id, exec_id, shares=0):
+        with self.lock:
+            if exec_id not in self.exec_orders:
+                self.exec_shares[order_id] = self.exec_shares.get(order_id, 0) + shares
+            self.exec_ids.setdefault(order_id, set()).add(exec_id)
+            self.exec_orders[exec_id] = order_id
+            self._check(order_id)
+
+    def record_commission(self, exec_id):
+        with self.lock:
+            self.commissions.add(exec_id)
+            if exec_id in self.exec_orders:
+                self._check(self.exec_orders[exec_id])
+
+    def is_complete(self, order_id):
+        with self.lock:
+            event = self.events.get(order_id)
+        return event is not None and event.is_set()
+
+    def wait_for_fills(self, order_ids, timeout=None):
+        """Block until every order is complete or the timeout expires; returns the order_ids still pending"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pending = []
+        for order_id in order_ids:
+            event = self.register(order_id)
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not event.wait(remaining):
+                pending.append(order_id)
+        return pending
+
+    async def wait_for_fills_async(self, order_ids, timeout=None):
+        """asyncio version of wait_for_fills; the broker's callback threads resolve the futures"""
+        loop = asyncio.get_running_loop()
+        futures = {}
+        with self.lock:
+            for order_id in order_ids:
+                event = self.events.setdefault(order_id, threading.Event())
+                if not event.is_set():
+                    future = loop.create_future()
+                    self.async_waiters.setdefault(order_id, []).append((loop, future))
+                    futures[future] = order_id
+        if not futures:
+            return []
+        try:
+            done, pending = await asyncio.wait(list(futures), timeout=timeout)
+            for future in pending:
+                future.cancel()
+            return [futures[future] for future in pending]
+        finally:
+            # Drop this call's waiters so a late fill doesn't touch a finished (or closed) loop
+            with self.lock:
+                for future, order_id in futures.items():
+                    waiters = [w for w in self.async_waiters.get(order_id, []) if w[1] is not future]
+                    if waiters:
+                        self.async_waiters[order_id] = waiters
+                    else:
+                        self.async_waiters.pop(order_id, None)
+
+
+# Accumulates every partial fill per order: total shares, notional for VWAP and summed commission
+class ExecutionLedger:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.orders = {}           # order_id -> {'shares', 'notional', 'commission', 'fills'}
+        self.exec_orders = {}      # execId -> order_id
+        self.exec_commission = {}  # execId -> commission (reports can arrive before execDetails)
+        self.listeners = []        # callback(order_id, exec_id, shares, price) per new fill
+
+    def add_listener(self, callback):
+        with self.lock:
+            self.listeners.append(callback)
+
+    def _entry(self, order_id):
+        return self.orders.setdefault(order_id, {'shares': 0.0, 'notional': 0.0, 'commission': 0.0, 'fills': 0})
+
+    def add_execution(self, order_id, exec_id, shares, price):
+        with self.lock:
+            if exec_id in self.exec_orders:
+                return  # Duplicate execDetails (e.g. after reqExecutions)
+            self.exec_orders[exec_id] = order_id
+            entry = self._entry(order_id)
+            entry['shares'] += float(shares)
+            entry['notional'] += float(shares) * float(price)
+            entry['fills'] += 1
+            if exec_id in self.exec_commission:
+                entry['commission'] += self.exec_commission[exec_id]
+            listeners = list(self.listeners)
+        # Outside the lock so a listener can call summary()
+        for callback in listeners:
+            try:
+                callback(order_id, exec_id, shares, price)
+            except Exception as e:
+                print(f"Error in fill listener: {str(e)}")
+
+    def add_commission(self, exec_id, commission):
+        try:
+            commission = float(commission)
+        except (TypeError, ValueError):
+            return
+        if commission > 1e300:
+            return  # TWS sends UNSET_DOUBLE when the commission isn't known yet
+        with self.lock:
+            previous = self.exec_commission.get(exec_id, 0.0)
+            self.exec_commission[exec_id] = commission
+            if exec_id in self.exec_orders:
+                self._entry(self.exec_orders[exec_id])['commission'] += commission - previous
+
+    def summary(self, order_id):
+        """{'shares', 'avg_price', 'commission', 'fills'} for an order, or None if nothing filled"""
+        with self.lock:
+            entry = self.orders.get(order_id)
+            if entry is None or entry['shares'] == 0:
+                return None
+            return {
+                'shares': entry['shares'],
+                'avg_price': entry['notional'] / entry['shares'],
+                'commission': entry['commission'],
+                'fills': entry['fills']
+            }
+
+
+# Common interface for the execution backends (TWS, Web API, simulator). The pipeline only
+# relies on these methods plus the order_status / account_summary / execution_ledger attributes.
+class Broker(ABC):
+    @abstractmethod
+    def place_order(self, action, quantity, symbol, order_type="MOC", tif="DAY"):
+        """Submit an order; returns an order id or None"""
+
+    @abstractmethod
+    def request_account_summary(self):
+        """Refresh self.account_summary ({account: {tag: {'value', 'currency'}}})"""
+
+    def wait_for_account_summary(self, timeout=3):
+        return True
+
+    @abstractmethod
+    def get_positions(self):
+        """Current positions from the broker, one dict per position"""
+
+    def add_fill_listener(self, callback):
+        """Call callback(order_id, exec_id, shares, price) for every new fill, on the broker's callback thread"""
+        self.execution_ledger.add_listener(callback)
+
+    def wait_for_fills(self, order_ids, timeout=None):
+        """Wait until the orders are filled (with commissions) or otherwise done; returns pending order_ids"""
+        return self.fill_tracker.wait_for_fills(order_ids, timeout)
+
+    def disconnect(self):
+        pass
+
+
+# In-process broker that fills orders at configurable prices and latencies, so the daily
+# pipeline can be run and timed offline
+class SimulatedBroker(Broker):
+    def __init__(self, prices=None, default_price=100.0, fill_latency=0.0, partial_fills=1,
+                 commission_per_share=0.005, min_commission=1.0, cash=1000000.0, account_id='SIM'):
+        self.prices = prices or {}          # dict or callable(symbol) -> fill price
+        self.default_price = default_price
+        self.fill_latency = fill_latency    # seconds, or callable(symbol) -> seconds
+        self.partial_fills = max(1, partial_fills)
+        self.commission_per_share = commission_per_share
+        self.min_commission = min_commission
+        self.cash = cash
+        self.account_id = account_id
+        self.connected = True
+        self.positions = {}
+        self.order_status = {}
+        self.execution_details = {}
+        self.commission_details = {}
+        self.account_summary = {}
+        self.fill_tracker = OrderCompletionTracker()
+        self.execution_ledger = ExecutionLedger()
+        self.lock = threading.Lock()
+        self.next_order_id = 1
+        self.timers = []
+
+    def _price(self, symbol):
+        if callable(self.prices):
+            return self.prices(symbol)
+        return self.prices.get(symbol, self.default_price)
+
+    def place_order(self, action, quantity, symbol, order_type="MOC", tif="DAY"):
+        with self.lock:
+            order_id = self.next_order_id
+            self.next_order_id += 1
+            self.order_status[order_id] = {'status': 'Submitted', 'filled': 0, 'remaining': quantity, 'avgFillPrice': 0}
+        self.fill_tracker.register(order_id, quantity)
+        self.fill_tracker.update_status(order_id, 'Submitted')
+        
+        latency = self.fill_latency(symbol) if callable(self.fill_latency) else self.fill_latency
+        timer = threading.Timer(latency, self._fill, args=(order_id, action, quantity, symbol))
+        timer.daemon = True
+        self.timers.append(timer)
+        timer.start()
+        return order_id
+
+    def _fill(self, order_id, action, quantity, symbol):
+        price = float(self._price(symbol))
+        sign = 1 if action == "BUY" else -1
+        # Split into partial fills the way large MOC orders come back from IBKR
+        pieces = min(self.partial_fills, int(quantity)) or 1
+        sizes = [quantity // pieces] * pieces
+        sizes[-1] += quantity - sum(sizes)
+        
+        for n, shares in enumerate(sizes):
+            exec_id = f"sim-{order_id}-{n}"
+            commission = max(self.min_commission / pieces, shares * self.commission_per_share)
+            self.execution_details[order_id] = {
+                'execId': exec_id,
+                'time': datetime.datetime.now().strftime("%Y%m%d %H:%M:%S"),
+                'acctNumber': self.account_id,
+                'shares': shares,
+                'price': price
+            }
+            self.commission_details[exec_id] = {'commission': commission, 'currency': 'USD', 'realizedPNL': 0}
+            self.execution_ledger.add_execution(order_id, exec_id, shares, price)
+            self.execution_ledger.add_commission(exec_id, commission)
+            self.fill_tracker.record_execution(order_id, exec_id, shares)
+            self.fill_tracker.record_commission(exec_id)
+            with self.lock:
+                self.positions[symbol] = self.positions.get(symbol, 0) + sign * shares
+                self.cash -= sign * shares * price + commission
+                
+        self.order_status[order_id] = {'status': 'Filled', 'filled': quantity, 'remaining': 0, 'avgFillPrice': price}
+        self.fill_tracker.update_status(order_id, 'Filled')
+
+    def request_account_summary(self):
+        with self.lock:
+            market_value = sum(position * float(self._price(symbol)) for symbol, position in self.positions.items())
+            cash = self.cash
+        self.account_summary = {self.account_id: {
+            'NetLiquidation': {'value': str(cash + market_value), 'currency': 'USD'},
+            'TotalCashValue': {'value': str(cash), 'currency': 'USD'},
+            'AvailableFunds': {'value': str(cash), 'currency': 'USD'},
+            'AccruedCash': {'value': '0', 'currency': 'USD'}
+        }}
+        return True
+
+    def get_positions(self):
+        with self.lock:
+            return [{'ticker': symbol, 'position': position} for symbol, position in self.positions.items() if position]
+
+    def disconnect(self):
+        for timer in self.timers:
+            timer.cancel()
+        self.connected = False
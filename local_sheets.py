@@ -0,0 +1,58 @@
+"""
+Offline stand-in for RateLimitedClient, used by `--simulated` runs of order_exec_v11.py and
+order_exec_v11_ibind.py. Each strategy sheet is read from a CSV file with the same columns as
+the Google Sheet (Date, Ticker, Target Position, ...), so the pipeline needs no credentials.
+
+Fixture directory layout (default fixtures/simulation):
+    strategy1.csv, strategy2.csv, ...   one per strategy sheet URL, in order
+    prices.csv (optional)               Ticker,Price fill prices for SimulatedBroker
+"""
+import csv
+import os
+from types import SimpleNamespace
+
+
+class LocalWorksheet:
+    def __init__(self, path):
+        self.path = path
+        self.title = os.path.splitext(os.path.basename(path))[0]
+
+    def get_all_values(self):
+        with open(self.path, newline='') as f:
+            return [row for row in csv.reader(f)]
+
+    def get_all_records(self):
+        with open(self.path, newline='') as f:
+            return list(csv.DictReader(f))
+
+
+class LocalSheetClient:
+    """Serves the read calls the strategy sheet loaders make (open_by_url + get_worksheet) from CSV files"""
+    def __init__(self, sheet_files):
+        self.sheet_files = dict(sheet_files)  # sheet url -> csv path
+        # fetch_strategy_sheets sizes its pool from the read bucket
+        self.buckets = {'read': SimpleNamespace(capacity=max(1, len(self.sheet_files)))}
+
+    def open_by_url(self, url):
+        path = self.sheet_files.get(url)
+        if path is None or not os.path.exists(path):
+            raise FileNotFoundError(f"No local fixture for {url} ({path})")
+        return path
+
+    def get_worksheet(self, spreadsheet, index):
+        if index != 0:
+            raise IndexError(f"Local fixtures have a single worksheet, not {index}")
+        return LocalWorksheet(spreadsheet)
+
+
+def load_simulation_fixtures(fixtures_dir, sheet_urls):
+    """Return (LocalSheetClient for sheet_urls, {ticker: fill price}) from fixtures_dir"""
+    client = LocalSheetClient({url: os.path.join(fixtures_dir, f"strategy{i + 1}.csv")
+                               for i, url in enumerate(sheet_urls)})
+    prices = {}
+    prices_file = os.path.join(fixtures_dir, 'prices.csv')
+    if os.path.exists(prices_file):
+        with open(prices_file, newline='') as f:
+            for row in csv.DictReader(f):
+                prices[row['Ticker']] = float(row['Price'])
+    return client, prices
@@ -1,10 +1,13 @@
+import sys
 import time
+import os
 import json
 import datetime
 import gspread
 import threading
 import pytz  # For timezone handling
 import sqlite3
+import pathlib
 from sqlite3 import Error
 from oauth2client.service_account import ServiceAccountCredentials
 # from ibapi.client import EClient
@@ -21,51 +24,534 @@ import yfinance as yf
 import datetime
 import threading
 import random
+import csv
+import bisect
+import numpy as np
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+from brokers import Broker, SimulatedBroker, OrderCompletionTracker, ExecutionLedger
+from local_sheets import load_simulation_fixtures
 
 ibind_logs_initialize()
 
 
+# Token bucket used to pace Google Sheets API calls
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0  # tokens added per second
+        self.capacity = float(burst if burst is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.last_refill = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if they are available right now; never blocks"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def reserve(self, tokens=1):
+        """
+        Reserve tokens and return how many seconds the caller must wait before using them.
+        The balance may go negative, so callers queue up in order without holding the lock.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until the tokens are available (sleeps outside the lock)"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        """Awaitable version of acquire for use on an asyncio event loop"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+# Proxies that charge every gspread call to the right quota bucket
+class RateLimitedWorksheet:
+    READ_METHODS = {
+        'get_all_values', 'get_all_records', 'get_values', 'get', 'batch_get',
+        'col_values', 'row_values', 'acell', 'cell', 'find', 'findall', 'range'
+    }
+    WRITE_METHODS = {
+        'batch_update', 'update', 'update_cell', 'update_cells', 'update_acell',
+        'append_row', 'append_rows', 'insert_row', 'insert_rows', 'delete_rows',
+        'clear', 'batch_clear', 'resize', 'add_rows', 'add_cols', 'format', 'update_title'
+    }
+
+    def __init__(self, worksheet, rate_limited_client):
+        self._worksheet = worksheet
+        self._client = rate_limited_client
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if name in self.READ_METHODS:
+            kind = 'read'
+        elif name in self.WRITE_METHODS:
+            kind = 'write'
+        else:
+            return attr  # Local attributes (id, title, row_count...) cost nothing
+
+        def rate_limited_call(*args, **kwargs):
+            self._client._wait_if_needed(kind)
+            return attr(*args, **kwargs)
+        return rate_limited_call
+
+    def __eq__(self, other):
+        return self._worksheet == getattr(other, '_worksheet', other)
+
+    def __hash__(self):
+        return hash(self._worksheet)
+
+    def __repr__(self):
+        return f"RateLimitedWorksheet({self._worksheet!r})"
+
+
+class RateLimitedSpreadsheet:
+    READ_METHODS = {'fetch_sheet_metadata', 'values_get', 'values_batch_get'}
+    WRITE_METHODS = {
+        'batch_update', 'values_update', 'values_append', 'values_clear',
+        'values_batch_update', 'del_worksheet', 'duplicate_sheet', 'share', 'update_title'
+    }
+
+    def __init__(self, spreadsheet, rate_limited_client):
+        self._spreadsheet = spreadsheet
+        self._client = rate_limited_client
+
+    @property
+    def sheet1(self):
+        return self._client.get_worksheet(self, 0)
+
+    def get_worksheet(self, index):
+        return self._client.get_worksheet(self, index)
+
+    def worksheet(self, title):
+        return self._client.worksheet(self, title)
+
+    def worksheets(self):
+        return self._client.worksheets(self)
+
+    def add_worksheet(self, title, rows, cols, **kwargs):
+        return self._client.add_worksheet(self, title, rows=rows, cols=cols, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self._spreadsheet, name)
+        if name in self.READ_METHODS:
+            kind = 'read'
+        elif name in self.WRITE_METHODS:
+            kind = 'write'
+        else:
+            return attr
+
+        def rate_limited_call(*args, **kwargs):
+            self._client._wait_if_needed(kind)
+            return attr(*args, **kwargs)
+        return rate_limited_call
+
+    def __repr__(self):
+        return f"RateLimitedSpreadsheet({self._spreadsheet!r})"
+
+
 # Enhanced rate limiting for Google Sheets API
 class RateLimitedClient:
-    def __init__(self, credentials_file, max_calls_per_minute=60):
+    def __init__(self, credentials_file, max_calls_per_minute=60, cache_ttl=300, cache_size=64,
+                 reads_per_minute=None, writes_per_minute=None, burst=10):
         scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
         creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_file, scope)
         self.client = gspread.authorize(creds)
         self.max_calls_per_minute = max_calls_per_minute
-        self.call_timestamps = []
-        self.lock = threading.Lock()
 
-    def _wait_if_needed(self):
-        """Wait if we're approaching the rate limit"""
-        with self.lock:
-            now = time.time()
-            # Remove timestamps older than 60 seconds
-            self.call_timestamps = [ts for ts in self.call_timestamps if now - ts < 60]
-            # If we're at the limit, wait until we can make another call
-            if len(self.call_timestamps) >= self.max_calls_per_minute:
-                oldest = min(self.call_timestamps)
-                sleep_time = 61 - (now - oldest)
-                if sleep_time > 0:
-                    print(f"Rate limit approaching. Waiting {sleep_time:.2f} seconds...")
-                    time.sleep(sleep_time)
-                # After waiting, update now and clean timestamps again
-                now = time.time()
-                self.call_timestamps = [ts for ts in self.call_timestamps if now - ts < 60]
-            # Add current timestamp
-            self.call_timestamps.append(now)
-            # Add jitter to avoid synchronization problems
-            jitter = random.uniform(0.1, 0.5)
-            time.sleep(jitter)
+        # Google meters read and write requests against separate per-minute quotas
+        self.buckets = {
+            'read': TokenBucket(reads_per_minute or max_calls_per_minute, burst),
+            'write': TokenBucket(writes_per_minute or max_calls_per_minute, burst)
+        }
+
+        # Spreadsheet/Worksheet handle cache (LRU with TTL) so helpers that
+        # re-open the same strategy sheet don't spend a quota slot every time
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+        self.spreadsheet_cache = OrderedDict()  # spreadsheet_id -> (spreadsheet, expires_at)
+        self.worksheet_cache = OrderedDict()    # (spreadsheet_id, title/index) -> (worksheet, expires_at)
+        self.title_to_id = {}
+
+    def _wait_if_needed(self, kind='read'):
+        """Wait until the read or write quota bucket has room for another call"""
+        wait = self.buckets[kind].reserve()
+        if wait > 1:
+            print(f"Rate limit approaching. Waiting {wait:.2f} seconds for {kind} quota...")
+        if wait > 0:
+            time.sleep(wait)
+
+    def try_acquire(self, kind='read'):
+        """Non-blocking check: take a quota slot if one is free right now"""
+        return self.buckets[kind].try_acquire()
+
+    async def acquire_async(self, kind='read'):
+        """Awaitable quota acquisition for asyncio callers"""
+        await self.buckets[kind].acquire_async()
+
+    def _cache_get(self, cache, key):
+        """Return a cached handle if present and not expired, else None"""
+        with self.cache_lock:
+            entry = cache.get(key)
+            if entry is None:
+                return None
+            handle, expires_at = entry
+            if time.time() >= expires_at:
+                del cache[key]
+                return None
+            cache.move_to_end(key)
+            return handle
+
+    def _cache_put(self, cache, key, handle):
+        """Store a handle, evicting the least recently used entry when full"""
+        with self.cache_lock:
+            cache[key] = (handle, time.time() + self.cache_ttl)
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def invalidate(self, spreadsheet_id=None):
+        """Drop cached handles for one spreadsheet, or everything if no ID is given"""
+        with self.cache_lock:
+            if spreadsheet_id is None:
+                self.spreadsheet_cache.clear()
+                self.worksheet_cache.clear()
+                self.title_to_id.clear()
+                return
+            self.spreadsheet_cache.pop(spreadsheet_id, None)
+        self.invalidate_worksheets(spreadsheet_id)
+
+    def invalidate_worksheets(self, spreadsheet_id):
+        """Drop cached worksheet handles for a spreadsheet (e.g. after adding a tab)"""
+        with self.cache_lock:
+            for key in [k for k in self.worksheet_cache if k[0] == spreadsheet_id]:
+                del self.worksheet_cache[key]
 
     def open_by_url(self, url):
-        """Open a spreadsheet by URL with rate limiting"""
+        """Open a spreadsheet by URL with rate limiting (cached by spreadsheet ID)"""
+        spreadsheet_id = gspread.utils.extract_id_from_url(url)
+        spreadsheet = self._cache_get(self.spreadsheet_cache, spreadsheet_id)
+        if spreadsheet is not None:
+            return spreadsheet
         self._wait_if_needed()
-        return self.client.open_by_url(url)
+        spreadsheet = RateLimitedSpreadsheet(self.client.open_by_url(url), self)
+        self._cache_put(self.spreadsheet_cache, spreadsheet_id, spreadsheet)
+        return spreadsheet
 
     def open(self, title):
-        """Open a spreadsheet by title with rate limiting"""
+        """Open a spreadsheet by title with rate limiting (cached by spreadsheet ID)"""
+        spreadsheet_id = self.title_to_id.get(title)
+        if spreadsheet_id:
+            spreadsheet = self._cache_get(self.spreadsheet_cache, spreadsheet_id)
+            if spreadsheet is not None:
+                return spreadsheet
         self._wait_if_needed()
-        return self.client.open(title)
+        spreadsheet = RateLimitedSpreadsheet(self.client.open(title), self)
+        with self.cache_lock:
+            self.title_to_id[title] = spreadsheet.id
+        self._cache_put(self.spreadsheet_cache, spreadsheet.id, spreadsheet)
+        return spreadsheet
+
+    def _unwrap(self, spreadsheet):
+        return getattr(spreadsheet, '_spreadsheet', spreadsheet)
+
+    def get_worksheet(self, spreadsheet, index):
+        """Get a rate-limited worksheet by index, using the handle cache when possible"""
+        key = (spreadsheet.id, index)
+        worksheet = self._cache_get(self.worksheet_cache, key)
+        if worksheet is not None:
+            return worksheet
+        self._wait_if_needed()
+        worksheet = self._unwrap(spreadsheet).get_worksheet(index)
+        if worksheet is None:
+            return None
+        worksheet = RateLimitedWorksheet(worksheet, self)
+        self._cache_put(self.worksheet_cache, key, worksheet)
+        return worksheet
+
+    def worksheet(self, spreadsheet, title):
+        """Get a rate-limited worksheet by title, using the handle cache when possible"""
+        key = (spreadsheet.id, title)
+        worksheet = self._cache_get(self.worksheet_cache, key)
+        if worksheet is not None:
+            return worksheet
+        self._wait_if_needed()
+        worksheet = RateLimitedWorksheet(self._unwrap(spreadsheet).worksheet(title), self)
+        self._cache_put(self.worksheet_cache, key, worksheet)
+        return worksheet
+
+    def worksheets(self, spreadsheet):
+        """List rate-limited worksheets (one metadata call) and cache each by title and index"""
+        key = (spreadsheet.id, '*')
+        worksheets = self._cache_get(self.worksheet_cache, key)
+        if worksheets is not None:
+            return worksheets
+        self._wait_if_needed()
+        worksheets = [RateLimitedWorksheet(ws, self) for ws in self._unwrap(spreadsheet).worksheets()]
+        for index, worksheet in enumerate(worksheets):
+            self._cache_put(self.worksheet_cache, (spreadsheet.id, index), worksheet)
+            self._cache_put(self.worksheet_cache, (spreadsheet.id, worksheet.title), worksheet)
+        self._cache_put(self.worksheet_cache, key, worksheets)
+        return worksheets
+
+    def add_worksheet(self, spreadsheet, title, rows, cols, **kwargs):
+        """Add a worksheet and invalidate cached handles for its spreadsheet"""
+        self._wait_if_needed('write')
+        worksheet = self._unwrap(spreadsheet).add_worksheet(title=title, rows=rows, cols=cols, **kwargs)
+        # Indexes of the spreadsheet's tabs may have shifted
+        self.invalidate_worksheets(spreadsheet.id)
+        worksheet = RateLimitedWorksheet(worksheet, self)
+        self._cache_put(self.worksheet_cache, (spreadsheet.id, title), worksheet)
+        return worksheet
+
+# In-memory copy of every tab of a spreadsheet, loaded with one values:batchGet
+class SpreadsheetSnapshot:
+    def __init__(self, spreadsheet, worksheets, value_ranges):
+        self.spreadsheet = spreadsheet
+        self.worksheets = list(worksheets)
+        self.titles = [ws.title for ws in self.worksheets]
+        self.tab_values = {}
+        self.row_indexes = {}
+        for title, rows in zip(self.titles, value_ranges):
+            # Pad rows to a rectangle the same way get_all_values() does
+            width = max((len(row) for row in rows), default=0)
+            self.tab_values[title] = [row + [''] * (width - len(row)) for row in rows]
+
+    def _title(self, tab):
+        if isinstance(tab, int):
+            return self.titles[tab] if 0 <= tab < len(self.titles) else None
+        return tab if tab in self.tab_values else None
+
+    def has(self, tab):
+        return self._title(tab) is not None
+
+    def worksheet(self, tab):
+        """Worksheet handle for a tab given by title or index (None if missing)"""
+        title = self._title(tab)
+        if title is None:
+            return None
+        return self.worksheets[self.titles.index(title)]
+
+    def values(self, tab):
+        """All values of a tab as get_all_values() would return them"""
+        title = self._title(tab)
+        return self.tab_values.get(title, []) if title is not None else []
+
+    def col_values(self, tab, col):
+        """Values of a 1-indexed column as col_values() would return them"""
+        column = [row[col - 1] if len(row) >= col else '' for row in self.values(tab)]
+        while column and column[-1] == '':
+            column.pop()
+        return column
+
+    def add_tab(self, worksheet, values=None):
+        """Register a tab created after the snapshot was taken"""
+        self.worksheets.append(worksheet)
+        self.titles.append(worksheet.title)
+        self.tab_values[worksheet.title] = values or []
+
+    def row_index(self, tab, date_col, ticker_col):
+        """(date, ticker) -> row lookup for a tab, built once and shared by all writers"""
+        title = self._title(tab)
+        key = (title, date_col, ticker_col)
+        if key not in self.row_indexes:
+            self.row_indexes[key] = SheetRowIndex(self.values(tab), date_col, ticker_col)
+        return self.row_indexes[key]
+
+
+# Maps (standardized date, ticker) to a 1-indexed sheet row and header names to columns,
+# so writers look rows up in O(1) instead of re-parsing every date on every update
+class SheetRowIndex:
+    def __init__(self, values, date_col, ticker_col):
+        self.date_col = date_col
+        self.ticker_col = ticker_col
+        self.rows = {}
+        for i, row in enumerate(values[1:], start=2):  # Start at row 2 (1-indexed)
+            if len(row) > max(date_col, ticker_col):
+                # Keep the first match, like the old top-down scan did
+                self.rows.setdefault((standardize_date_format(row[date_col]), row[ticker_col]), i)
+
+    def find(self, date, ticker):
+        """Row number for a date/ticker pair, or None"""
+        return self.rows.get((standardize_date_format(date), ticker))
+
+    def add(self, date, ticker, row_index):
+        """Record a row created after the index was built"""
+        self.rows.setdefault((standardize_date_format(date), ticker), row_index)
+
+
+# Collects pending cell writes per spreadsheet and flushes them with one values:batchUpdate
+class SheetWriteBuffer:
+    def __init__(self, spreadsheet, max_cells_per_request=40000):
+        self.spreadsheet = spreadsheet
+        self.max_cells_per_request = max_cells_per_request
+        self.cells = {}  # worksheet title -> {(row, col): value}
+        self.worksheets = {}  # worksheet title -> Worksheet, used to grow the grid before writing
+        self.lock = threading.Lock()
+
+    def _title(self, worksheet):
+        if isinstance(worksheet, str):
+            return worksheet
+        self.worksheets[worksheet.title] = worksheet
+        return worksheet.title
+
+    def add_cell(self, worksheet, row, col, value):
+        """Queue a single cell write (1-indexed row/col)"""
+        with self.lock:
+            title = self._title(worksheet)
+            self.cells.setdefault(title, {})[(row, col)] = value
+
+    def add_row(self, worksheet, row, values, col=1):
+        """Queue a run of cells on one row starting at col"""
+        with self.lock:
+            title = self._title(worksheet)
+            tab = self.cells.setdefault(title, {})
+            for offset, value in enumerate(values):
+                tab[(row, col + offset)] = value
+
+    def clear_range(self, worksheet, rows, cols):
+        """Blank rows x cols from A1 in the same batch as the writes that replace them
+        
+        Unlike worksheet.clear(), nothing is erased unless the rewrite is sent too.
+        Cells already queued (or queued later) keep their values.
+        """
+        with self.lock:
+            title = self._title(worksheet)
+            tab = self.cells.setdefault(title, {})
+            for row in range(1, rows + 1):
+                for col in range(1, cols + 1):
+                    tab.setdefault((row, col), "")
+
+    def pending(self):
+        return sum(len(tab) for tab in self.cells.values())
+
+    def _merged_ranges(self):
+        """Merge queued cells into as few rectangular ranges as possible"""
+        data = []
+        for title, tab in self.cells.items():
+            # Group contiguous columns on each row into segments
+            segments = []
+            for row, col in sorted(tab):
+                last = segments[-1] if segments else None
+                if last and last['row'] == row and last['col'] + len(last['values']) == col:
+                    last['values'].append(tab[(row, col)])
+                else:
+                    segments.append({'row': row, 'col': col, 'values': [tab[(row, col)]]})
+            
+            # Stack segments on consecutive rows that cover the same columns
+            blocks = []
+            for seg in sorted(segments, key=lambda s: (s['col'], len(s['values']), s['row'])):
+                last = blocks[-1] if blocks else None
+                if (last and last['col'] == seg['col'] and len(last['rows'][0]) == len(seg['values'])
+                        and last['row'] + len(last['rows']) == seg['row']):
+                    last['rows'].append(seg['values'])
+                else:
+                    blocks.append({'row': seg['row'], 'col': seg['col'], 'rows': [seg['values']]})
+            
+            sheet_name = "'{}'".format(title.replace("'", "''"))
+            for block in blocks:
+                start = gspread.utils.rowcol_to_a1(block['row'], block['col'])
+                end = gspread.utils.rowcol_to_a1(block['row'] + len(block['rows']) - 1,
+                                                 block['col'] + len(block['rows'][0]) - 1)
+                data.append({'range': f"{sheet_name}!{start}:{end}", 'values': block['rows']})
+        return data
+
+    def _grow_grids(self, extents):
+        """values:batchUpdate can't write past a tab's grid, so add rows/columns first where needed"""
+        for title, (max_row, max_col) in extents.items():
+            worksheet = self.worksheets.get(title)
+            if worksheet is None:
+                continue
+            if max_row > worksheet.row_count:
+                retry_with_backoff(worksheet.add_rows, max_row - worksheet.row_count)
+            if max_col > worksheet.col_count:
+                retry_with_backoff(worksheet.add_cols, max_col - worksheet.col_count)
+
+    def flush(self):
+        """Send every queued write; splits only when a request would exceed max_cells_per_request"""
+        with self.lock:
+            data = self._merged_ranges()
+            extents = {title: (max(row for row, _ in tab), max(col for _, col in tab))
+                       for title, tab in self.cells.items() if tab}
+            self.cells = {}
+        if not data:
+            return 0
+        
+        self._grow_grids(extents)
+        
+        requests = []
+        chunk, chunk_cells = [], 0
+        for item in data:
+            cells = len(item['values']) * len(item['values'][0])
+            if chunk and chunk_cells + cells > self.max_cells_per_request:
+                requests.append(chunk)
+                chunk, chunk_cells = [], 0
+            chunk.append(item)
+            chunk_cells += cells
+        requests.append(chunk)
+        
+        for chunk in requests:
+            retry_with_backoff(self.spreadsheet.values_batch_update,
+                               {'valueInputOption': 'RAW', 'data': chunk})
+        return len(requests)
+
+
+# Holds one SheetWriteBuffer per spreadsheet touched during a run
+class SheetWriteCoalescer:
+    def __init__(self, max_cells_per_request=40000):
+        self.max_cells_per_request = max_cells_per_request
+        self.buffers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def buffer_for(self, spreadsheet):
+        with self.lock:
+            if spreadsheet.id not in self.buffers:
+                self.buffers[spreadsheet.id] = SheetWriteBuffer(spreadsheet, self.max_cells_per_request)
+            return self.buffers[spreadsheet.id]
+
+    def flush_all(self):
+        """Flush every spreadsheet's buffer; returns the number of batchUpdate calls made
+        
+        Every buffer is attempted; if any failed, raises RuntimeError naming those spreadsheets.
+        """
+        calls = 0
+        failed = []
+        for spreadsheet_id, buffer in list(self.buffers.items()):
+            try:
+                calls += buffer.flush()
+            except Exception as e:
+                print(f"Error flushing writes for spreadsheet {spreadsheet_id}: {str(e)}")
+                failed.append(spreadsheet_id)
+        if failed:
+            raise RuntimeError(f"Sheet writes failed for spreadsheet(s): {', '.join(failed)}")
+        return calls
+
 
 # class DatabaseHandler:
 #     def __init__(self, db_file='trading_data.db'):
@@ -189,21 +675,128 @@ class RateLimitedClient:
 #         except Error as e:
 #             print(f"Error fetching trades: {e}")
 #             return []
+
+
+def _migrate_iso_dates(cursor):
+    """Rewrite any non-ISO dates so text ordering and equality lookups on `date` are correct.
+    Dates that don't parse come back unchanged and are left as they are."""
+    cursor.execute("SELECT id, date FROM trades WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'")
+    for row_id, date in cursor.fetchall():
+        iso_date = standardize_date_format(date)
+        if iso_date != date:
+            cursor.execute("UPDATE trades SET date = ? WHERE id = ?", (iso_date, row_id))
+    cursor.execute("SELECT strategy_idx, date FROM strategy_cash WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'")
+    for strategy_idx, date in cursor.fetchall():
+        iso_date = standardize_date_format(date)
+        if iso_date == date:
+            continue
+        # If the ISO spelling of the same day already exists for this strategy, keep that row
+        cursor.execute("UPDATE OR IGNORE strategy_cash SET date = ? WHERE strategy_idx = ? AND date = ?",
+                       (iso_date, strategy_idx, date))
+        cursor.execute("DELETE FROM strategy_cash WHERE strategy_idx = ? AND date = ?", (strategy_idx, date))
+
+
+# Applied in order, once per database; each entry is (name, list of SQL statements or a callable(cursor))
+SCHEMA_MIGRATIONS = [
+    ('001_trades_date_ticker_index', [
+        "CREATE INDEX IF NOT EXISTS idx_trades_date_ticker ON trades(date, ticker)",
+    ]),
+    ('002_trades_ticker_date_index', [
+        # Per-ticker history (WHERE ticker = ? ORDER BY date)
+        "CREATE INDEX IF NOT EXISTS idx_trades_ticker_date ON trades(ticker, date)",
+    ]),
+    ('003_iso_dates', _migrate_iso_dates),
+    ('004_position_events_index', [
+        # Replay for loads (WHERE book = ? AND id > ?) and as-of-date queries
+        "CREATE INDEX IF NOT EXISTS idx_position_events_book_date ON position_events(book, trade_date)",
+    ]),
+    ('005_price_coverage_refreshed_at', [
+        # When each ticker was last downloaded, so today's still-moving bar is refreshed on a TTL
+        "ALTER TABLE price_coverage ADD COLUMN refreshed_at TEXT",
+    ]),
+]
+
+
 class DatabaseHandler:
-    def __init__(self, db_file='trading_data.db'):
+    TRADE_INSERT_SQL = """
+    INSERT INTO trades (
+        date, ticker, net_units, total_abs_units, trade_price, 
+        adj_close, trade_type, pre_trade_position, delta_shares, 
+        post_trade_position, commission, interest, nav
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+    """
+    
+    STRATEGY_CASH_SQL = """
+    INSERT OR REPLACE INTO strategy_cash (strategy_idx, date, cash)
+    VALUES (?, ?, ?);
+    """
+    
+    def __init__(self, db_file='trading_data.db', migrate=True):
         self.db_file = db_file
         self.conn = None
+        # Writes queued by unit_of_work(), per thread so other threads neither join nor see a batch
+        self._batch = threading.local()
+        # One writer (self.conn, guarded by self.lock) plus a read-only connection per thread
+        self._readers = threading.local()
+        self._readers_lock = threading.Lock()
+        self._reader_connections = []
         self.create_connection()
         self.create_tables()
+        if migrate:
+            self.apply_migrations()
 
     def create_connection(self):
         try:
             self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            # WAL lets the strategy monitor read while we write; with WAL, NORMAL only fsyncs at checkpoints
+            self.conn.execute('PRAGMA journal_mode=WAL;')
+            self.conn.execute('PRAGMA synchronous=NORMAL;')
             self.lock = threading.Lock()  # Add a lock for thread safety
             print(f"Connected to SQLite database {self.db_file}")
         except Error as e:
             print(f"Error connecting to database: {e}")
             
+    @contextmanager
+    def read_cursor(self):
+        """Cursor for queries on this thread's read-only connection, so reads don't queue behind self.lock
+        
+        With WAL, readers see the last committed state while the single writer (self.conn) is busy.
+        In-memory databases can't be shared between connections and fall back to the locked writer.
+        """
+        conn = self._read_connection()
+        if conn is None:
+            with self.lock:
+                yield self.conn.cursor()
+        else:
+            yield conn.cursor()
+            
+    def _read_connection(self):
+        conn = getattr(self._readers, 'conn', None)
+        if conn is not None or self.db_file == ':memory:':
+            return conn
+        try:
+            conn = sqlite3.connect(pathlib.Path(self.db_file).resolve().as_uri() + '?mode=ro', uri=True,
+                                   check_same_thread=False, timeout=30.0)
+        except Error as e:
+            print(f"Error opening read-only connection, using the writer: {e}")
+            return None
+        self._readers.conn = conn
+        with self._readers_lock:
+            self._reader_connections.append(conn)
+        return conn
+        
+    def close(self):
+        """Close the writer and every thread's read-only connection"""
+        with self._readers_lock:
+            for conn in self._reader_connections:
+                conn.close()
+            self._reader_connections = []
+        self._readers = threading.local()
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+            
     def create_tables(self):
         with self.lock:
             try:
@@ -240,20 +833,133 @@ class DatabaseHandler:
                 );
                 """
                 
+                # Local daily close history, so prices are only downloaded once
+                price_history_table = """
+                CREATE TABLE IF NOT EXISTS price_history (
+                    ticker TEXT,
+                    date TEXT,
+                    close REAL,
+                    PRIMARY KEY (ticker, date)
+                );
+                """
+                
+                # Last date for which each ticker's history is known to be complete
+                price_coverage_table = """
+                CREATE TABLE IF NOT EXISTS price_coverage (
+                    ticker TEXT PRIMARY KEY,
+                    covered_through TEXT
+                );
+                """
+                
+                # Symbol -> IBKR contract id, so orders don't need a contract search every day
+                contract_cache_table = """
+                CREATE TABLE IF NOT EXISTS contract_cache (
+                    symbol TEXT PRIMARY KEY,
+                    conid INTEGER,
+                    updated_at TEXT
+                );
+                """
+                
+                # Durable queue for delayed work such as the post-trade sheet/NAV update
+                scheduled_jobs_table = """
+                CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_key TEXT UNIQUE,
+                    job_type TEXT,
+                    payload TEXT,
+                    run_at TEXT,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    max_attempts INTEGER DEFAULT 3,
+                    last_error TEXT,
+                    created_at TEXT,
+                    updated_at TEXT
+                );
+                """
+                
+                # Append-only position log per book (a PositionTracker's storage_file), with compacted snapshots
+                position_events_table = """
+                CREATE TABLE IF NOT EXISTS position_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    book TEXT,
+                    ticker TEXT,
+                    delta NUMERIC,
+                    position NUMERIC,
+                    trade_date TEXT,
+                    source TEXT,
+                    recorded_at TEXT
+                );
+                """
+                
+                position_snapshots_table = """
+                CREATE TABLE IF NOT EXISTS position_snapshots (
+                    book TEXT,
+                    event_id INTEGER,
+                    positions TEXT,
+                    created_at TEXT,
+                    PRIMARY KEY (book, event_id)
+                );
+                """
+                
                 cursor.execute(trades_table)
                 cursor.execute(strategy_cash_table)
+                cursor.execute(price_history_table)
+                cursor.execute(price_coverage_table)
+                cursor.execute(scheduled_jobs_table)
+                cursor.execute(position_events_table)
+                cursor.execute(position_snapshots_table)
+                cursor.execute(contract_cache_table)
                 self.conn.commit()
                 print("Tables created successfully")
             except Error as e:
                 print(f"Error creating tables: {e}")
+            
+    def apply_migrations(self):
+        """Apply any SCHEMA_MIGRATIONS not yet recorded in schema_migrations, then refresh planner statistics"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    name TEXT PRIMARY KEY,
+                    applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+                );
+                """)
+                cursor.execute("SELECT name FROM schema_migrations")
+                applied = {row[0] for row in cursor.fetchall()}
+                self.conn.commit()
+                
+                pending = [(name, steps) for name, steps in SCHEMA_MIGRATIONS if name not in applied]
+                for name, steps in pending:
+                    try:
+                        if callable(steps):
+                            steps(cursor)
+                        else:
+                            for statement in steps:
+                                cursor.execute(statement)
+                        cursor.execute("INSERT INTO schema_migrations (name) VALUES (?)", (name,))
+                        self.conn.commit()
+                        print(f"Applied migration {name}")
+                    except Error as e:
+                        self.conn.rollback()
+                        print(f"Error applying migration {name}: {e}")
+                        return False
+                        
+                if pending:
+                    # Give the query planner row counts for the new indexes
+                    cursor.execute("ANALYZE")
+                    self.conn.commit()
+                return True
+            except Error as e:
+                print(f"Error applying migrations: {e}")
+                return False
     
     def export_to_sheet(self, detail_worksheet):
-        with self.lock:
+        with self.read_cursor() as cursor:
             # Get current date in Eastern timezone
             eastern = pytz.timezone('US/Eastern')
             current_date = datetime.datetime.now(eastern).strftime("%Y-%m-%d")
             
-            cursor = self.conn.cursor()
             # Modified query to filter by today's date
             cursor.execute("SELECT * FROM trades WHERE date = ? ORDER BY id DESC", (current_date,))
             rows = cursor.fetchall()
@@ -265,46 +971,138 @@ class DatabaseHandler:
                 formatted_row = row[1:14] # Indices 1-13 contain the trade data
                 formatted_rows.append(formatted_row)
                 
-            # Add rows in batches to avoid API limits
-            batch_size = 10  # Reduced batch size from 100 to 10
-            for i in range(0, len(formatted_rows), batch_size):
-                batch = formatted_rows[i:i+batch_size]
-                for row_data in batch:
-                    detail_worksheet.append_row(row_data)
-                time.sleep(1.2)  # Wait ~1.2 seconds between batches
+            # Append all rows in a single request
+            if formatted_rows:
+                detail_worksheet.append_rows([list(row) for row in formatted_rows])
                 
             print(f"Exported {len(formatted_rows)} rows to Google Sheet (today's data only)")
             return True
     
+    @contextmanager
+    def unit_of_work(self):
+        """Queue trade, strategy cash and position writes made on this thread and commit them in one
+        transaction on exit
+        
+        Nested blocks join the outermost one. If the block raises, the queued writes are discarded;
+        if the commit fails, the error is raised.
+        """
+        state = self._batch_state()
+        state.depth += 1
+        try:
+            yield self
+        except Exception:
+            state.depth -= 1
+            if state.depth == 0:
+                state.trades, state.cash, state.position_writes = [], {}, []
+                self._run_unit_callbacks(state, committed=False)
+            raise
+        state.depth -= 1
+        if state.depth == 0:
+            try:
+                with self.lock:
+                    self._flush_pending(state)
+            except Exception:
+                self._run_unit_callbacks(state, committed=False)
+                raise
+            self._run_unit_callbacks(state, committed=True)
+            
+    def in_unit_of_work(self):
+        """True if this thread is inside unit_of_work(), i.e. writes are queued rather than committed"""
+        return self._batch_state().depth > 0
+        
+    def after_unit(self, on_commit, on_rollback=None):
+        """Call on_commit once this thread's unit_of_work() commits, or on_rollback if it doesn't"""
+        state = self._batch_state()
+        if not state.depth:
+            on_commit()
+            return
+        state.callbacks.append((on_commit, on_rollback))
+        
+    def _run_unit_callbacks(self, state, committed):
+        callbacks, state.callbacks = state.callbacks, []
+        for on_commit, on_rollback in callbacks:
+            callback = on_commit if committed else on_rollback
+            if callback is not None:
+                callback()
+                
+    def _batch_state(self):
+        """This thread's unit_of_work() queue"""
+        state = self._batch
+        if not hasattr(state, 'depth'):
+            state.depth = 0
+            state.trades = []
+            state.cash = {}
+            state.position_writes = []  # (write(cursor, *args), args) in call order
+            state.callbacks = []        # (on_commit, on_rollback) registered with after_unit()
+        return state
+                
+    def _flush_pending(self, state):
+        """Write queued rows in a single transaction; the caller holds self.lock. Raises on error."""
+        trades, cash, position_writes = state.trades, state.cash, state.position_writes
+        state.trades, state.cash, state.position_writes = [], {}, []
+        if not trades and not cash and not position_writes:
+            return
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(self.TRADE_INSERT_SQL, trades)
+            cursor.executemany(self.STRATEGY_CASH_SQL,
+                               [(strategy_idx, date, value) for (strategy_idx, date), value in cash.items()])
+            for write, args in position_writes:
+                write(cursor, *args)
+            self.conn.commit()
+            print(f"Committed {len(trades)} trade(s), {len(cash)} cash snapshot(s) and "
+                  f"{len(position_writes)} position write(s) in one transaction")
+        except Error as e:
+            self.conn.rollback()
+            print(f"Error committing batched writes: {e}")
+            raise
+            
     def insert_trade(self, trade_data):
+        """Insert one trade row; inside unit_of_work() the row is queued and None is returned"""
         with self.lock:
             # Standardize the date format if it's the first element in trade_data
             if trade_data and len(trade_data) > 0:
                 trade_data[0] = standardize_date_format(trade_data[0])
                 
-            sql = """
-            INSERT INTO trades (
-                date, ticker, net_units, total_abs_units, trade_price, 
-                adj_close, trade_type, pre_trade_position, delta_shares, 
-                post_trade_position, commission, interest, nav
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-            """
-            
+            state = self._batch_state()
+            if state.depth:
+                state.trades.append(trade_data)
+                return None
+                
             try:
                 cursor = self.conn.cursor()
-                cursor.execute(sql, trade_data)
+                cursor.execute(self.TRADE_INSERT_SQL, trade_data)
                 self.conn.commit()
                 return cursor.lastrowid
             except Error as e:
                 print(f"Error inserting trade data: {e}")
                 return None
                 
-    def get_recent_trades(self, limit=100):
+    def insert_trades_bulk(self, trades):
+        """Insert many insert_trade rows with one executemany and one commit; returns the number of rows"""
+        rows = [[standardize_date_format(trade_data[0])] + list(trade_data[1:]) for trade_data in trades if trade_data]
+        if not rows:
+            return 0
+        state = self._batch_state()
+        if state.depth:
+            state.trades.extend(rows)
+            return len(rows)
         with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.executemany(self.TRADE_INSERT_SQL, rows)
+                self.conn.commit()
+                return len(rows)
+            except Error as e:
+                self.conn.rollback()
+                print(f"Error inserting trade data: {e}")
+                return 0
+                
+    def get_recent_trades(self, limit=100):
+        with self.read_cursor() as cursor:
             sql = "SELECT * FROM trades ORDER BY id DESC LIMIT ?"
             
             try:
-                cursor = self.conn.cursor()
                 cursor.execute(sql, (limit,))
                 return cursor.fetchall()
             except Error as e:
@@ -317,14 +1115,14 @@ class DatabaseHandler:
             # Standardize date format
             date = standardize_date_format(date)
             
-            sql = """
-            INSERT OR REPLACE INTO strategy_cash (strategy_idx, date, cash)
-            VALUES (?, ?, ?);
-            """
-            
+            state = self._batch_state()
+            if state.depth:
+                state.cash[(strategy_idx, date)] = cash
+                return True
+                
             try:
                 cursor = self.conn.cursor()
-                cursor.execute(sql, (strategy_idx, date, cash))
+                cursor.execute(self.STRATEGY_CASH_SQL, (strategy_idx, date, cash))
                 self.conn.commit()
                 return True
             except Error as e:
@@ -332,73 +1130,384 @@ class DatabaseHandler:
                 return False
         
     def get_previous_day_cash(self, strategy_idx):
-        """Get the most recent cash value for a strategy"""
-        with self.lock:
+        """Get the most recent cash value for a strategy, including values this thread's unit_of_work() queued"""
+        pending = [(date, value) for (idx, date), value in self._batch_state().cash.items() if idx == strategy_idx]
+        with self.read_cursor() as cursor:
             sql = """
-            SELECT cash FROM strategy_cash 
+            SELECT date, cash FROM strategy_cash 
             WHERE strategy_idx = ? 
             ORDER BY date DESC 
             LIMIT 1;
             """
             
             try:
-                cursor = self.conn.cursor()
                 cursor.execute(sql, (strategy_idx,))
                 result = cursor.fetchone()
-                return result[0] if result else None
+                candidates = ([result] if result else []) + pending
+                return max(candidates)[1] if candidates else None
             except Error as e:
                 print(f"Error getting previous day cash: {e}")
                 return None
-    
 
-    
-    def store_strategy_cash(self, strategy_idx, date, cash):
-        """Store cash value for a strategy on a given date"""
-        # Standardize date format
-        date = standardize_date_format(date)
+           
+
+
+
+    def get_price_coverage(self, tickers):
+        """Map of ticker -> (last date whose close is stored for good, UTC time of the last download)
+        Tickers never stored are omitted."""
+        with self.read_cursor() as cursor:
+            coverage = {}
+            try:
+                for ticker in tickers:
+                    cursor.execute("SELECT covered_through, refreshed_at FROM price_coverage WHERE ticker = ?", (ticker,))
+                    result = cursor.fetchone()
+                    if result:
+                        coverage[ticker] = (result[0], result[1])
+            except Error as e:
+                print(f"Error reading price coverage: {e}")
+            return coverage
+            
+    def store_price_history(self, history, covered_through, covered_tickers=None):
+        """Store daily closes ({ticker: [(date, close), ...]}) and advance coverage to covered_through
+        for covered_tickers (default: the tickers that returned data)"""
+        if covered_tickers is None:
+            # A ticker with no bars is left uncovered so its gap is requested again next time
+            covered_tickers = [ticker for ticker, bars in history.items() if bars]
+        refreshed_at = datetime.datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO price_history (ticker, date, close) VALUES (?, ?, ?);",
+                    [(ticker, date, close) for ticker, bars in history.items() for date, close in bars]
+                )
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO price_coverage (ticker, covered_through, refreshed_at) VALUES (?, ?, ?);",
+                    [(ticker, covered_through, refreshed_at) for ticker in covered_tickers]
+                )
+                self.conn.commit()
+                return True
+            except Error as e:
+                print(f"Error storing price history: {e}")
+                return False
+                
+    def has_closes_between(self, start_date, end_date):
+        """True if any ticker has a stored close in [start_date, end_date], i.e. the market traded then"""
+        with self.read_cursor() as cursor:
+            try:
+                cursor.execute("SELECT 1 FROM price_history WHERE date >= ? AND date <= ? LIMIT 1;",
+                               (start_date, end_date))
+                return cursor.fetchone() is not None
+            except Error as e:
+                print(f"Error reading price history: {e}")
+                return True
+                
+    def get_latest_closes(self, tickers, date, lookback_days=7):
+        """Most recent stored close on or before date (within lookback_days) for each ticker"""
+        start = (datetime.datetime.strptime(date, "%Y-%m-%d") - datetime.timedelta(days=lookback_days)).strftime("%Y-%m-%d")
+        with self.read_cursor() as cursor:
+            closes = {}
+            try:
+                for ticker in tickers:
+                    cursor.execute("""
+                    SELECT close FROM price_history
+                    WHERE ticker = ? AND date >= ? AND date <= ?
+                    ORDER BY date DESC
+                    LIMIT 1;
+                    """, (ticker, start, date))
+                    result = cursor.fetchone()
+                    closes[ticker] = result[0] if result else None
+            except Error as e:
+                print(f"Error reading price history: {e}")
+            return closes
+            
+    def enqueue_job(self, job_key, job_type, payload, run_at, max_attempts=3):
+        """Add a job unless one with the same job_key already exists (idempotent); run_at is a UTC datetime"""
+        with self.lock:
+            now = datetime.datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("""
+                INSERT OR IGNORE INTO scheduled_jobs
+                    (job_key, job_type, payload, run_at, status, attempts, max_attempts, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'pending', 0, ?, ?, ?);
+                """, (job_key, job_type, json.dumps(payload, default=list),
+                      run_at.strftime("%Y-%m-%d %H:%M:%S"), max_attempts, now, now))
+                self.conn.commit()
+                return cursor.rowcount > 0
+            except Error as e:
+                print(f"Error enqueuing job {job_key}: {e}")
+                return False
+                
+    def claim_due_jobs(self):
+        """Mark pending jobs whose run_at has passed as running and return them"""
+        with self.lock:
+            now = datetime.datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
+            jobs = []
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("""
+                SELECT id, job_key, job_type, payload, attempts, max_attempts FROM scheduled_jobs
+                WHERE status = 'pending' AND run_at <= ?
+                ORDER BY run_at;
+                """, (now,))
+                for job_id, job_key, job_type, payload, attempts, max_attempts in cursor.fetchall():
+                    cursor.execute("UPDATE scheduled_jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'pending'",
+                                   (now, job_id))
+                    if cursor.rowcount:
+                        jobs.append({'id': job_id, 'job_key': job_key, 'job_type': job_type,
+                                     'payload': json.loads(payload), 'attempts': attempts,
+                                     'max_attempts': max_attempts})
+                self.conn.commit()
+            except Error as e:
+                print(f"Error claiming jobs: {e}")
+            return jobs
+            
+    def complete_job(self, job_id):
+        with self.lock:
+            try:
+                self.conn.execute("UPDATE scheduled_jobs SET status = 'done', updated_at = ? WHERE id = ?",
+                                  (datetime.datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S"), job_id))
+                self.conn.commit()
+            except Error as e:
+                print(f"Error completing job {job_id}: {e}")
+                
+    def fail_job(self, job_id, error, retry_delay_seconds):
+        """Record a failure; the job is retried after the delay until max_attempts is reached"""
+        with self.lock:
+            now = datetime.datetime.now(pytz.utc)
+            retry_at = (now + datetime.timedelta(seconds=retry_delay_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                self.conn.execute("""
+                UPDATE scheduled_jobs
+                SET attempts = attempts + 1,
+                    status = CASE WHEN attempts + 1 >= max_attempts THEN 'failed' ELSE 'pending' END,
+                    run_at = ?, last_error = ?, updated_at = ?
+                WHERE id = ?;
+                """, (retry_at, str(error), now.strftime("%Y-%m-%d %H:%M:%S"), job_id))
+                self.conn.commit()
+            except Error as e:
+                print(f"Error recording failure for job {job_id}: {e}")
+                
+    def requeue_interrupted_jobs(self):
+        """Jobs left 'running' by a process that died are made pending again"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("UPDATE scheduled_jobs SET status = 'pending' WHERE status = 'running'")
+                self.conn.commit()
+                return cursor.rowcount
+            except Error as e:
+                print(f"Error requeuing jobs: {e}")
+                return 0
+                
+    def next_job_time(self):
+        """UTC datetime of the earliest pending job, or None"""
+        with self.read_cursor() as cursor:
+            try:
+                cursor.execute("SELECT MIN(run_at) FROM scheduled_jobs WHERE status = 'pending'")
+                result = cursor.fetchone()
+                if result and result[0]:
+                    return datetime.datetime.strptime(result[0], "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.utc)
+            except Error as e:
+                print(f"Error reading job queue: {e}")
+            return None
+            
+    def get_cached_conids(self, symbols, max_age_hours):
+        """Cached conids for symbols refreshed within max_age_hours"""
+        cutoff = (datetime.datetime.now(pytz.utc) - datetime.timedelta(hours=max_age_hours)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.read_cursor() as cursor:
+            conids = {}
+            try:
+                for symbol in symbols:
+                    cursor.execute("SELECT conid FROM contract_cache WHERE symbol = ? AND updated_at >= ?",
+                                   (symbol, cutoff))
+                    result = cursor.fetchone()
+                    if result:
+                        conids[symbol] = result[0]
+            except Error as e:
+                print(f"Error reading contract cache: {e}")
+            return conids
+            
+    def store_conid(self, symbol, conid):
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute(
+                    "INSERT OR REPLACE INTO contract_cache (symbol, conid, updated_at) VALUES (?, ?, ?);",
+                    (symbol, conid, datetime.datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S"))
+                )
+                self.conn.commit()
+                return True
+            except Error as e:
+                print(f"Error storing conid for {symbol}: {e}")
+                return False
+
+            
+    def append_position_event(self, book, ticker, delta, position, trade_date, source='trade'):
+        """Append one position change for a book (a PositionTracker's storage_file)
         
-        sql = """
-        INSERT OR REPLACE INTO strategy_cash (strategy_idx, date, cash)
-        VALUES (?, ?, ?);
+        Returns the event id, True if it was queued by unit_of_work(), or None on error.
         """
-        
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute(sql, (strategy_idx, date, cash))
-            self.conn.commit()
+        args = (book, ticker, delta, position, trade_date, source,
+                datetime.datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S"))
+        state = self._batch_state()
+        if state.depth:
+            state.position_writes.append((self._write_position_event, args))
             return True
-        except Error as e:
-            print(f"Error storing strategy cash: {e}")
-            return False
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._write_position_event(cursor, *args)
+                self.conn.commit()
+                return cursor.lastrowid
+            except Error as e:
+                self.conn.rollback()
+                print(f"Error recording position event for {book} {ticker}: {e}")
+                return None
+                
+    def _write_position_event(self, cursor, book, ticker, delta, position, trade_date, source, recorded_at):
+        cursor.execute("""
+        INSERT INTO position_events (book, ticker, delta, position, trade_date, source, recorded_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?);
+        """, (book, ticker, delta, position, trade_date, source, recorded_at))
+                
+    def import_positions(self, book, positions, trade_date):
+        """Seed a book's log from existing positions (e.g. its old JSON file) as one batch plus a snapshot"""
+        recorded_at = datetime.datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.executemany("""
+                INSERT INTO position_events (book, ticker, delta, position, trade_date, source, recorded_at)
+                VALUES (?, ?, ?, ?, ?, 'import', ?);
+                """, [(book, ticker, position, position, trade_date, recorded_at)
+                      for ticker, position in positions.items() if position != 0])
+                cursor.execute("SELECT MAX(id) FROM position_events WHERE book = ?", (book,))
+                cursor.execute("INSERT OR REPLACE INTO position_snapshots (book, event_id, positions, created_at) VALUES (?, ?, ?, ?)",
+                               (book, cursor.fetchone()[0] or 0, json.dumps(positions), recorded_at))
+                self.conn.commit()
+                return True
+            except Error as e:
+                self.conn.rollback()
+                print(f"Error importing positions for {book}: {e}")
+                return False
+                
+    def store_position_snapshot(self, book, positions):
+        """Record positions as of the book's latest event, so loads only replay newer events"""
+        # Serialised now: inside unit_of_work() the tracker keeps changing positions before the commit
+        args = (book, json.dumps(positions), datetime.datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S"))
+        state = self._batch_state()
+        if state.depth:
+            state.position_writes.append((self._write_position_snapshot, args))
+            return True
+        with self.lock:
+            try:
+                self._write_position_snapshot(self.conn.cursor(), *args)
+                self.conn.commit()
+                return True
+            except Error as e:
+                self.conn.rollback()
+                print(f"Error storing position snapshot for {book}: {e}")
+                return False
+                
+    def _write_position_snapshot(self, cursor, book, positions_json, created_at):
+        # Queued events are written first, so MAX(id) covers every event the snapshot includes
+        cursor.execute("SELECT MAX(id) FROM position_events WHERE book = ?", (book,))
+        event_id = cursor.fetchone()[0] or 0
+        cursor.execute("INSERT OR REPLACE INTO position_snapshots (book, event_id, positions, created_at) VALUES (?, ?, ?, ?)",
+                       (book, event_id, positions_json, created_at))
+        # Only the newest snapshot is needed; the events stay for as-of-date queries
+        cursor.execute("DELETE FROM position_snapshots WHERE book = ? AND event_id < ?", (book, event_id))
+                
+    def load_positions(self, book):
+        """Positions from the latest snapshot plus the events after it, or None if the book has no history
         
-    def get_previous_day_cash(self, strategy_idx):
-        """Get the most recent cash value for a strategy"""
-        sql = """
-        SELECT cash FROM strategy_cash 
-        WHERE strategy_idx = ? 
-        ORDER BY date DESC 
-        LIMIT 1;
+        A read error is raised rather than returned, so it can't be mistaken for an empty book.
         """
-        
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute(sql, (strategy_idx,))
-            result = cursor.fetchone()
-            return result[0] if result else None
-        except Error as e:
-            print(f"Error getting previous day cash: {e}")
-            return None
+        with self.read_cursor() as cursor:
+            try:
+                cursor.execute("""
+                SELECT event_id, positions FROM position_snapshots
+                WHERE book = ?
+                ORDER BY event_id DESC
+                LIMIT 1;
+                """, (book,))
+                snapshot = cursor.fetchone()
+                event_id, positions = (snapshot[0], json.loads(snapshot[1])) if snapshot else (0, {})
+                
+                cursor.execute("SELECT ticker, delta FROM position_events WHERE book = ? AND id > ? ORDER BY id",
+                               (book, event_id))
+                events = cursor.fetchall()
+                if snapshot is None and not events:
+                    return None
+                    
+                for ticker, delta in events:
+                    positions[ticker] = positions.get(ticker, 0) + delta
+                return {ticker: position for ticker, position in positions.items() if position != 0}
+            except Error as e:
+                print(f"Error loading positions for {book}: {e}")
+                raise
+                
+    def get_positions_as_of(self, book, date):
+        """Positions of a book at the end of date (YYYY-MM-DD), replayed from its event log"""
+        with self.read_cursor() as cursor:
+            try:
+                cursor.execute("""
+                SELECT ticker, SUM(delta) FROM position_events
+                WHERE book = ? AND trade_date <= ?
+                GROUP BY ticker
+                HAVING SUM(delta) != 0;
+                """, (book, date))
+                return dict(cursor.fetchall())
+            except Error as e:
+                print(f"Error reading positions as of {date} for {book}: {e}")
+                return {}
 
-           
 
+# Events between automatic snapshots of a tracker's position log
+POSITION_SNAPSHOT_INTERVAL = 200
 
 
 class PositionTracker:
-    def __init__(self, storage_file='positions.json'):
+    """Positions per ticker for one book (storage_file)
+    
+    With a ledger (a DatabaseHandler), every change is appended to the position_events log in
+    trading_data.db and positions load from the latest snapshot plus newer events; the JSON file
+    is then only an export written by save_positions() and the one-time seed for an empty log.
+    Without one, the JSON file is rewritten on every change as before.
+    
+    Inside the ledger's unit_of_work(), changes are staged: get_position() sees them, but
+    self.positions (what save_positions() writes) only changes once the unit commits.
+    """
+    def __init__(self, storage_file='positions.json', ledger=None):
         self.storage_file = storage_file
+        self.ledger = ledger
+        self._events_since_snapshot = 0
+        self._staged = {}  # ticker -> position waiting for the ledger's unit_of_work() to commit
         self.positions = self._load_positions()
         
     def _load_positions(self):
+        if self.ledger is not None:
+            try:
+                positions = self.ledger.load_positions(self.storage_file)
+            except Error:
+                # The book may have history we couldn't read: use the last JSON export, but don't
+                # seed the log from it or the positions would be counted twice
+                print(f"Using {self.storage_file} until the position log can be read")
+                return self._read_json()
+            if positions is not None:
+                return positions
+                
+        positions = self._read_json()
+        if self.ledger is not None:
+            # First load with a ledger: start the log from the JSON file
+            eastern = pytz.timezone('US/Eastern')
+            self.ledger.import_positions(self.storage_file, positions, datetime.datetime.now(eastern).strftime("%Y-%m-%d"))
+        return positions
+        
+    def _read_json(self):
         try:
             with open(self.storage_file, 'r') as f:
                 return json.load(f)
@@ -406,26 +1515,77 @@ class PositionTracker:
             return {}
             
     def save_positions(self):
-        with open(self.storage_file, 'w') as f:
+        if self.ledger is not None:
+            self.ledger.store_position_snapshot(self.storage_file, self.positions)
+            self._events_since_snapshot = 0
+            
+        # Write a temp file and swap it in, so a crash never leaves a half-written file
+        tmp_file = self.storage_file + '.tmp'
+        with open(tmp_file, 'w') as f:
             json.dump(self.positions, f, indent=2)
+        os.replace(tmp_file, self.storage_file)
             
     def get_position(self, ticker):
+        if ticker in self._staged:
+            return self._staged[ticker]
         return self.positions.get(ticker, 0)
         
+    def positions_as_of(self, date):
+        """Positions at the end of a past date, from the ledger (None without one)"""
+        if self.ledger is None:
+            return None
+        return self.ledger.get_positions_as_of(self.storage_file, standardize_date_format(date))
     
-    def update_position(self, ticker, delta):
-        current = self.positions.get(ticker, 0)
-        new_position = current + delta
+    def update_position(self, ticker, delta, trade_date=None):
+        new_position = self.get_position(ticker) + delta
         
-        if new_position == 0:
+        if self.ledger is None:
+            self._apply(ticker, new_position)
+            self.save_positions()
+            return
+            
+        # Append one event instead of rewriting the whole file; memory only changes once it is recorded
+        if trade_date is None:
+            eastern = pytz.timezone('US/Eastern')
+            trade_date = datetime.datetime.now(eastern).strftime("%Y-%m-%d")
+        if self.ledger.append_position_event(self.storage_file, ticker, delta, new_position,
+                                             standardize_date_format(trade_date)) is None:
+            raise RuntimeError(f"Could not record position change for {ticker} in {self.storage_file}")
+            
+        if self.ledger.in_unit_of_work():
+            # Queued, not committed: apply when the unit commits, drop if it rolls back
+            if not self._staged:
+                self.ledger.after_unit(self._commit_staged, self._staged.clear)
+            self._staged[ticker] = new_position
+        else:
+            self._apply(ticker, new_position)
+            
+        self._events_since_snapshot += 1
+        if self._events_since_snapshot >= POSITION_SNAPSHOT_INTERVAL:
+            self.ledger.store_position_snapshot(self.storage_file, self._current_positions())
+            self._events_since_snapshot = 0
+            
+    def _apply(self, ticker, position):
+        if position == 0:
             # If the position is now zero, remove the ticker from positions
-            if ticker in self.positions:
-                del self.positions[ticker]
+            self.positions.pop(ticker, None)
         else:
-            # Otherwise update with the new position
-            self.positions[ticker] = new_position
-        
-        self.save_positions()
+            self.positions[ticker] = position
+            
+    def _commit_staged(self):
+        for ticker, position in self._staged.items():
+            self._apply(ticker, position)
+        self._staged.clear()
+        
+    def _current_positions(self):
+        """Committed positions with staged changes applied"""
+        positions = dict(self.positions)
+        for ticker, position in self._staged.items():
+            if position == 0:
+                positions.pop(ticker, None)
+            else:
+                positions[ticker] = position
+        return positions
 
 
 # class TradingApp(EWrapper, EClient):
@@ -577,16 +1737,28 @@ class PositionTracker:
 #             return req_id
 #         return None
 
-class IBKRClientWrapper:
-    def __init__(self):
+
+class IBKRClientWrapper(Broker):
+    CONID_CACHE_TTL_HOURS = 24 * 7  # Contract ids rarely change; refresh weekly
+
+    def __init__(self, conid_store=None):
         # Use OAuth authentication with environment variables
         self.client = IbkrClient(use_oauth=True)
+        self.conid_store = conid_store  # DatabaseHandler used to persist symbol -> conid
+        self.conids = {}
+        self.conid_lock = threading.Lock()
         self.account_id = None
         self.connected = False
         self.order_status = {}
         self.execution_details = {}
         self.commission_details = {}
         self.account_summary = {}
+        self.fill_tracker = OrderCompletionTracker()
+        self.execution_ledger = ExecutionLedger()
+        self.order_seq = 0
+        self.order_seq_lock = threading.Lock()  # place_order may be called from several threads
+        self.poller_thread = None
+        self.poller_stop = threading.Event()
         
     def connect(self):
         try:
@@ -610,6 +1782,7 @@ class IBKRClientWrapper:
             return False
 
     def disconnect(self):
+        self.stop_order_poller()
         self.connected = False
         print("Disconnected from IBKR Web API")
 
@@ -634,15 +1807,15 @@ class IBKRClientWrapper:
 
             # conid = search_results[0]['conid']
 
-            search_results = self.client.search_contract_by_symbol(symbol).data
-            if not search_results:
-                print(f"Could not find contract for {symbol}")
+            conid = self.resolve_conid(symbol)
+            if conid is None:
                 return None
 
-            conid = int(search_results[0]['conid'])  # Convert to integer
-
-            # Create order request
-            order_tag = f'order-{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}'
+            # Create order request; the sequence keeps tags unique when orders go out in the same second
+            with self.order_seq_lock:
+                self.order_seq += 1
+                order_seq = self.order_seq
+            order_tag = f'order-{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}-{order_seq}'
             order_request = OrderRequest(
                 conid=conid,
                 side=action,
@@ -674,6 +1847,7 @@ class IBKRClientWrapper:
                 'remaining': quantity,
                 'avgFillPrice': 0
             }
+            self.fill_tracker.register(order_tag, quantity)
 
             return order_tag
 
@@ -681,6 +1855,152 @@ class IBKRClientWrapper:
             print(f"Error placing order: {str(e)}")
             return None
 
+    def resolve_conid(self, symbol):
+        """Contract id for a symbol: memory, then trading_data.db, then a contract search"""
+        with self.conid_lock:
+            if symbol in self.conids:
+                return self.conids[symbol]
+        if self.conid_store is not None:
+            cached = self.conid_store.get_cached_conids([symbol], self.CONID_CACHE_TTL_HOURS)
+            if symbol in cached:
+                with self.conid_lock:
+                    self.conids[symbol] = cached[symbol]
+                return cached[symbol]
+                
+        search_results = self.client.search_contract_by_symbol(symbol).data
+        if not search_results:
+            print(f"Could not find contract for {symbol}")
+            return None
+
+        conid = int(search_results[0]['conid'])  # Convert to integer
+        with self.conid_lock:
+            self.conids[symbol] = conid
+        if self.conid_store is not None:
+            self.conid_store.store_conid(symbol, conid)
+        return conid
+
+    def prewarm_conids(self, symbols, max_workers=8):
+        """Resolve conids for all symbols up front so order placement is a single HTTP call.
+        Returns the symbols that could not be resolved."""
+        symbols = sorted(set(symbols))
+        if self.conid_store is not None:
+            with self.conid_lock:
+                self.conids.update(self.conid_store.get_cached_conids(symbols, self.CONID_CACHE_TTL_HOURS))
+        with self.conid_lock:
+            missing = [symbol for symbol in symbols if symbol not in self.conids]
+        resolved = {}
+        if missing:
+            def resolve(symbol):
+                try:
+                    return self.resolve_conid(symbol)
+                except Exception as e:
+                    print(f"Error resolving conid for {symbol}: {str(e)}")
+                    return None
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as executor:
+                resolved = dict(zip(missing, executor.map(resolve, missing)))
+        failed = sorted(symbol for symbol, conid in resolved.items() if conid is None)
+        print(f"Contract ids ready for {len(symbols) - len(missing)} cached + "
+              f"{len(missing) - len(failed)} looked-up symbol(s)")
+        if failed:
+            print(f"Could not resolve contract ids for: {', '.join(failed)}")
+        return failed
+
+    def wait_for_fills(self, order_ids, timeout=None):
+        """Wait until the orders are filled (with commissions) or otherwise done; returns pending order_ids"""
+        # The Web API has no push callbacks here, so poll order status while waiting
+        self.start_order_poller()
+        try:
+            return self.fill_tracker.wait_for_fills(order_ids, timeout)
+        finally:
+            self.stop_order_poller()
+            self.poll_orders()  # Final pass so late commissions are picked up
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def poll_orders(self):
+        """
+        Refresh every outstanding order tag with one live_orders call and one trades call,
+        filling order_status/execution_details/commission_details like TradingApp's callbacks.
+        """
+        outstanding = [tag for tag in self.order_status if not self.fill_tracker.is_complete(tag)]
+        if not outstanding:
+            return 0
+        outstanding_set = set(outstanding)
+        
+        try:
+            orders = self.client.live_orders(account_id=self.account_id).data or {}
+            for order in orders.get('orders', []):
+                tag = order.get('order_ref')
+                if tag not in outstanding_set:
+                    continue
+                self.order_status[tag] = {
+                    'status': order.get('status', self.order_status[tag]['status']),
+                    'filled': self._to_float(order.get('filledQuantity')),
+                    'remaining': self._to_float(order.get('remainingQuantity')),
+                    'avgFillPrice': self._to_float(order.get('avgPrice'))
+                }
+        except Exception as e:
+            print(f"Error polling live orders: {str(e)}")
+            
+        try:
+            trades = self.client.trades(account_id=self.account_id).data or []
+            for trade in trades:
+                tag = trade.get('order_ref')
+                exec_id = trade.get('execution_id')
+                if tag not in outstanding_set or not exec_id:
+                    continue
+                shares = self._to_float(trade.get('size'))
+                price = self._to_float(trade.get('price'))
+                self.execution_details[tag] = {
+                    'execId': exec_id,
+                    'time': trade.get('trade_time', ''),
+                    'acctNumber': trade.get('account', self.account_id),
+                    'shares': shares,
+                    'price': price
+                }
+                self.execution_ledger.add_execution(tag, exec_id, shares, price)
+                self.fill_tracker.record_execution(tag, exec_id, shares)
+                if trade.get('commission') not in (None, ''):
+                    self.commission_details[exec_id] = {
+                        'commission': self._to_float(trade.get('commission')),
+                        'currency': trade.get('currency', 'USD'),
+                        'realizedPNL': 0
+                    }
+                    self.execution_ledger.add_commission(exec_id, trade.get('commission'))
+                    self.fill_tracker.record_commission(exec_id)
+        except Exception as e:
+            print(f"Error polling trades: {str(e)}")
+            
+        # Status last, so a Filled order already has its executions recorded
+        for tag in outstanding:
+            self.fill_tracker.update_status(tag, self.order_status[tag]['status'])
+        return len(outstanding)
+
+    def start_order_poller(self, interval=5):
+        """Poll outstanding orders in the background every `interval` seconds"""
+        if self.poller_thread is not None and self.poller_thread.is_alive():
+            return
+        self.poller_stop.clear()
+        
+        def run():
+            while not self.poller_stop.is_set():
+                self.poll_orders()
+                self.poller_stop.wait(interval)
+                
+        self.poller_thread = threading.Thread(target=run, daemon=True)
+        self.poller_thread.start()
+
+    def stop_order_poller(self):
+        self.poller_stop.set()
+        if self.poller_thread is not None:
+            self.poller_thread.join(timeout=10)
+            self.poller_thread = None
+
     def request_account_summary(self):
         try:
             # Get account ledger
@@ -723,9 +2043,9 @@ class IBKRClientWrapper:
 def connect_to_google_sheets(rate_limited_client, sheet_url=None, sheet_name=None):
     try:
         if sheet_url:
-            worksheet = rate_limited_client.open_by_url(sheet_url).sheet1
+            worksheet = rate_limited_client.get_worksheet(rate_limited_client.open_by_url(sheet_url), 0)
         elif sheet_name:
-            worksheet = rate_limited_client.open(sheet_name).sheet1
+            worksheet = rate_limited_client.get_worksheet(rate_limited_client.open(sheet_name), 0)
         else:
             return None, None, "No sheet URL or name provided"
         
@@ -734,6 +2054,22 @@ def connect_to_google_sheets(rate_limited_client, sheet_url=None, sheet_name=Non
     except Exception as e:
         return None, None, str(e)
 
+def load_spreadsheet_snapshot(rate_limited_client, sheet_url):
+    """
+    Load every tab of a strategy spreadsheet with a single values:batchGet call.
+    The worksheet list comes from the client's handle cache, so a warm run costs one read.
+    """
+    spreadsheet = rate_limited_client.open_by_url(sheet_url)
+    worksheets = rate_limited_client.worksheets(spreadsheet)
+    if not worksheets:
+        return SpreadsheetSnapshot(spreadsheet, [], [])
+    
+    # Quote titles so tabs with spaces ("Daily NAV") are valid A1 ranges
+    ranges = ["'{}'".format(ws.title.replace("'", "''")) for ws in worksheets]
+    response = retry_with_backoff(spreadsheet.values_batch_get, ranges)
+    value_ranges = [vr.get('values', []) for vr in response.get('valueRanges', [])]
+    return SpreadsheetSnapshot(spreadsheet, worksheets, value_ranges)
+
 # def fetch_adjusted_closing_prices(tickers, current_date):
 #     """
 #     Fetch adjusted closing prices for a list of tickers using Yahoo Finance.
@@ -798,10 +2134,58 @@ def connect_to_google_sheets(rate_limited_client, sheet_url=None, sheet_name=Non
     
 #     return ticker_prices
 
-def fetch_adjusted_closing_prices(tickers, current_date):
+# Today's bar keeps moving until the close, so an intraday price is only reused this long
+INTRADAY_PRICE_TTL_SECONDS = 300
+
+
+# Process-wide cache of closing prices keyed by (ticker, date), shared by every strategy in a run
+class PriceCache:
+    def __init__(self, intraday_ttl=INTRADAY_PRICE_TTL_SECONDS):
+        self.prices = {}  # (ticker, date) -> (price, time.time() when stored)
+        self.intraday_ttl = intraday_ttl
+        self.lock = threading.Lock()
+
+    def lookup(self, tickers, date):
+        """Split tickers into cached prices and the ones still to download"""
+        eastern = pytz.timezone('US/Eastern')
+        intraday = date >= datetime.datetime.now(eastern).strftime("%Y-%m-%d")
+        now = time.time()
+        cached, missing = {}, []
+        with self.lock:
+            for ticker in tickers:
+                entry = self.prices.get((ticker, date))
+                if entry is not None and (not intraday or now - entry[1] < self.intraday_ttl):
+                    cached[ticker] = entry[0]
+                else:
+                    missing.append(ticker)
+        return cached, missing
+
+    def store(self, ticker_prices, date):
+        """Cache known prices; tickers with no price (None) are left out so the next lookup retries them"""
+        now = time.time()
+        with self.lock:
+            for ticker, price in ticker_prices.items():
+                if price is not None:
+                    self.prices[(ticker, date)] = (price, now)
+
+    def clear(self):
+        with self.lock:
+            self.prices.clear()
+
+
+price_cache = PriceCache()
+
+
+def fetch_adjusted_closing_prices(tickers, current_date, cache=price_cache, store=None, provider=None):
     """
     Fetch adjusted closing prices for a list of tickers using Yahoo Finance.
     
+    Prices already in the process-wide cache are served from memory; only the remaining
+    tickers are downloaded, in one batch. Pass cache=None to always hit Yahoo.
+    With a store (DatabaseHandler), closes are kept in trading_data.db and only the
+    dates after each ticker's stored history are requested. A PriceProvider, if given,
+    replaces both (e.g. a ReplayPriceProvider for offline runs) and is cached separately.
+    
     Args:
         tickers (list): List of ticker symbols
         current_date (str): Date in YYYY-MM-DD format
@@ -818,12 +2202,120 @@ def fetch_adjusted_closing_prices(tickers, current_date):
     except ValueError:
         print(f"Invalid date format: {current_date}")
         return {}
+        
+    def load(missing):
+        if provider is not None:
+            return provider.get_closes(missing, current_date)
+        if store is not None:
+            return _load_closing_prices_incremental(store, missing, current_date, date_obj)
+        return _download_closing_prices(missing, date_obj)
+        
+    if provider is not None and cache is price_cache:
+        # The shared cache holds Yahoo/store prices; a provider's prices never go into it
+        cache = provider.price_cache
+        
+    if cache is None:
+        downloaded = load(list(tickers))
+        return downloaded if downloaded is not None else {ticker: None for ticker in tickers}
+        
+    cached, missing = cache.lookup(tickers, current_date)
+    if missing:
+        downloaded = load(missing)
+        if downloaded is not None:
+            cache.store(downloaded, current_date)  # skips tickers that came back without a price
+            cached.update(downloaded)
+        else:
+            # Download failed; don't cache so a later call can retry
+            cached.update({ticker: None for ticker in missing})
+            
+    return {ticker: cached.get(ticker) for ticker in tickers}
+
+
+def prefetch_closing_prices(individual_sheet_data, individual_trackers, current_date, cache=price_cache, store=None,
+                            provider=None):
+    """Warm the price cache with one download covering every strategy's tickers for the day"""
+    tickers = set()
+    for i, strategy_data in enumerate(individual_sheet_data):
+        tickers.update(ticker for ticker, position in individual_trackers[i].positions.items() if position != 0)
+        tickers.update(row['ticker'] for row in strategy_data
+                       if standardize_date_format(row['date']) == current_date)
+    if tickers:
+        fetch_adjusted_closing_prices(sorted(tickers), current_date, cache=cache, store=store, provider=provider)
+    return len(tickers)
+
+
+def _load_closing_prices_incremental(store, tickers, current_date, date_obj):
+    """Serve closes from the local store, downloading only dates it doesn't cover yet"""
+    # Today's bar is still moving, so only days before today count as complete
+    eastern = pytz.timezone('US/Eastern')
+    last_complete = (datetime.datetime.now(eastern) - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+    complete_through = min(current_date, last_complete)
+    window_start = date_obj - datetime.timedelta(days=7)
+    now = datetime.datetime.now(pytz.utc)
     
+    coverage = store.get_price_coverage(tickers)
+    
+    def needs_download(ticker):
+        covered_through, refreshed_at = coverage.get(ticker, ('', None))
+        if covered_through < complete_through:
+            return True
+        if current_date <= last_complete:
+            return False
+        # Every complete day is stored; refresh today's bar once the stored one is older than the TTL
+        if not refreshed_at:
+            return True
+        refreshed = datetime.datetime.strptime(refreshed_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.utc)
+        return (now - refreshed).total_seconds() >= INTRADAY_PRICE_TTL_SECONDS
+        
+    stale = [ticker for ticker in tickers if needs_download(ticker)]
+    if stale:
+        # Start after the oldest coverage among stale tickers, but never before the lookback window
+        start_date = window_start
+        covered = [coverage[ticker][0] for ticker in stale if ticker in coverage]
+        if len(covered) == len(stale):
+            start_date = max(window_start, datetime.datetime.strptime(min(covered), "%Y-%m-%d") + datetime.timedelta(days=1))
+        history = _download_price_history(stale, start_date, date_obj)
+        # Coverage only advances on a successful download, so a failed one is retried next time.
+        # If nothing traded in the range (weekend/holiday: no bars downloaded or already stored for
+        # any ticker) the whole range is covered; otherwise only tickers that returned bars are
+        if history is not None:
+            covered_tickers = None
+            if not any(history.values()) and not store.has_closes_between(
+                    start_date.strftime("%Y-%m-%d"), date_obj.strftime("%Y-%m-%d")):
+                covered_tickers = stale
+            store.store_price_history(history, complete_through, covered_tickers)
+            
+    closes = store.get_latest_closes(tickers, current_date)
+    for ticker in tickers:
+        if closes.get(ticker) is None:
+            print(f"No data found for {ticker}")
+    return closes
+
+
+def _download_closing_prices(tickers, date_obj):
+    """Batch download the latest close up to date_obj; returns None if the download failed"""
     # Set range (to cover weekends/holidays)
     start_date = date_obj - datetime.timedelta(days=7)
+    history = _download_price_history(tickers, start_date, date_obj)
+    if history is None:
+        return None
+        
+    ticker_prices = {}
+    for ticker in tickers:
+        if history.get(ticker):
+            ticker_prices[ticker] = history[ticker][-1][1]
+        else:
+            print(f"No data found for {ticker}")
+            ticker_prices[ticker] = None
+    return ticker_prices
+
+
+def _download_price_history(tickers, start_date, date_obj):
+    """Batch download daily closes from start_date through date_obj as {ticker: [(date, close), ...]}.
+    Every ticker gets an empty list if the range has no trading days; returns None if the download failed."""
     end_date = date_obj + datetime.timedelta(days=1)  # include the date itself
 
-    ticker_prices = {}
+    history = {}
 
     try:
         # Download in batch (auto_adjust=True by default in latest yfinance)
@@ -835,44 +2327,131 @@ def fetch_adjusted_closing_prices(tickers, current_date):
         )
 
         if data.empty:
+            # Weekends and holidays: nothing traded in the requested range
             print("No data retrieved for any ticker.")
-            return {ticker: None for ticker in tickers}
-
-        # Single ticker returns a different shape
-        if len(tickers) == 1:
-            ticker = tickers[0]
-            if 'Close' in data.columns:
-                price_series = data['Close'].dropna()
-            else:
-                print(f"No 'Close' column found for {ticker}")
-                return {ticker: None}
+            return {ticker: [] for ticker in tickers}
 
-            if not price_series.empty:
-                ticker_prices[ticker] = price_series.iloc[-1]
-            else:
-                print(f"No data found for {ticker}")
-                ticker_prices[ticker] = None
+        if 'Close' not in data.columns:
+            print(f"No 'Close' column found for {', '.join(tickers)}")
+            return {ticker: [] for ticker in tickers}
+        close_prices = data['Close']
 
-        else:
-            # Multiple tickers case
-            close_prices = data['Close']
-            for ticker in tickers:
-                try:
+        for ticker in tickers:
+            try:
+                # Single ticker may come back as a plain series rather than one column per ticker
+                if hasattr(close_prices, 'columns'):
                     price_series = close_prices[ticker].dropna()
-                    if not price_series.empty:
-                        ticker_prices[ticker] = price_series.iloc[-1]
-                    else:
-                        print(f"No data found for {ticker}")
-                        ticker_prices[ticker] = None
-                except (KeyError, IndexError):
-                    print(f"No data found for {ticker}")
-                    ticker_prices[ticker] = None
+                else:
+                    price_series = close_prices.dropna()
+                history[ticker] = [(index.strftime("%Y-%m-%d"), float(price))
+                                   for index, price in price_series.items()]
+            except (KeyError, IndexError):
+                history[ticker] = []
 
     except Exception as e:
         print(f"Error fetching prices: {str(e)}")
-        return {ticker: None for ticker in tickers}
-
-    return ticker_prices
+        return None
+
+    return history
+
+
+# Price sources for NAV computation. get_closes returns {ticker: price or None}; None means
+# the provider doesn't know the price, so a CompositePriceProvider can fall through to the next one.
+class PriceProvider(ABC):
+    @abstractmethod
+    def get_closes(self, tickers, date):
+        """Return {ticker: close price or None} for the given date"""
+        
+    @property
+    def price_cache(self):
+        """This provider's own PriceCache, used by fetch_adjusted_closing_prices"""
+        if getattr(self, '_price_cache', None) is None:
+            self._price_cache = PriceCache()
+        return self._price_cache
+
+
+class YahooPriceProvider(PriceProvider):
+    """Latest close from Yahoo Finance (one batched download)"""
+    def get_closes(self, tickers, date):
+        prices = _download_closing_prices(list(tickers), datetime.datetime.strptime(date, "%Y-%m-%d"))
+        return prices if prices is not None else {ticker: None for ticker in tickers}
+
+
+class LocalStorePriceProvider(PriceProvider):
+    """Closes from the price_history table; refresh=False reads the store with no network at all"""
+    def __init__(self, store, refresh=True):
+        self.store = store
+        self.refresh = refresh
+
+    def get_closes(self, tickers, date):
+        if self.refresh:
+            return _load_closing_prices_incremental(self.store, list(tickers), date,
+                                                    datetime.datetime.strptime(date, "%Y-%m-%d"))
+        return self.store.get_latest_closes(list(tickers), date)
+
+
+class FillPriceProvider(PriceProvider):
+    """Today's IBKR fill prices taken from trade_results"""
+    def __init__(self, trade_results):
+        self.trade_results = trade_results
+
+    def get_closes(self, tickers, date):
+        prices = {}
+        for ticker in tickers:
+            price = self.trade_results.get(ticker, {}).get('price', 0)
+            prices[ticker] = price if price else None
+        return prices
+
+
+class ReplayPriceProvider(PriceProvider):
+    """Replays closes from a CSV or Parquet file with ticker, date and close columns"""
+    def __init__(self, path, lookback_days=7):
+        self.path = path
+        self.lookback_days = lookback_days
+        self.history = {}  # ticker -> sorted [(date, close), ...]
+        for ticker, date, close in self._read_rows(path):
+            self.history.setdefault(ticker, []).append((standardize_date_format(date), float(close)))
+        for bars in self.history.values():
+            bars.sort()
+
+    @staticmethod
+    def _read_rows(path):
+        if path.lower().endswith('.parquet'):
+            import pandas as pd  # Only needed for Parquet replay files
+            frame = pd.read_parquet(path, columns=['ticker', 'date', 'close'])
+            return [(row.ticker, str(row.date)[:10], row.close) for row in frame.itertuples(index=False)]
+        with open(path, newline='') as f:
+            return [(row['ticker'], row['date'], row['close']) for row in csv.DictReader(f) if row.get('close')]
+
+    def get_closes(self, tickers, date):
+        start = (datetime.datetime.strptime(date, "%Y-%m-%d") - datetime.timedelta(days=self.lookback_days)).strftime("%Y-%m-%d")
+        prices = {}
+        for ticker in tickers:
+            bars = self.history.get(ticker, [])
+            # Last bar on or before date, as long as it's inside the lookback window
+            i = bisect.bisect_right(bars, (date, float('inf')))
+            prices[ticker] = bars[i - 1][1] if i and bars[i - 1][0] >= start else None
+        return prices
+
+
+class CompositePriceProvider(PriceProvider):
+    """Asks each provider in priority order for the tickers still without a price"""
+    def __init__(self, providers):
+        self.providers = list(providers)
+
+    def get_closes(self, tickers, date):
+        prices = {ticker: None for ticker in tickers}
+        for provider in self.providers:
+            missing = [ticker for ticker, price in prices.items() if price is None]
+            if not missing:
+                break
+            try:
+                found = provider.get_closes(missing, date)
+            except Exception as e:
+                print(f"Error getting prices from {type(provider).__name__}: {str(e)}")
+                continue
+            prices.update({ticker: price for ticker, price in found.items() if price is not None})
+        return prices
 
 def get_strategy_nav(rate_limited_client, sheet_url):
     """
@@ -883,7 +2462,7 @@ def get_strategy_nav(rate_limited_client, sheet_url):
         
         # Get the Daily NAV sheet (3rd sheet)
         try:
-            nav_sheet = spreadsheet.get_worksheet(2)
+            nav_sheet = rate_limited_client.get_worksheet(spreadsheet, 2)
             if nav_sheet is None:
                 return 100000  # Default if sheet doesn't exist
         except:
@@ -921,9 +2500,9 @@ def update_combined_metrics_sheet(rate_limited_client, sheet_urls, app, individu
         
         # Check if the combined metrics sheet exists, create if not
         try:
-            combined_sheet = spreadsheet.worksheet("Combined Metrics")
+            combined_sheet = rate_limited_client.worksheet(spreadsheet, "Combined Metrics")
         except:
-            combined_sheet = spreadsheet.add_worksheet(title="Combined Metrics", rows=1000, cols=12)
+            combined_sheet = rate_limited_client.add_worksheet(spreadsheet, "Combined Metrics", rows=1000, cols=12)
             
         # The rest of the function remains the same
         # Define headers
@@ -939,7 +2518,6 @@ def update_combined_metrics_sheet(rate_limited_client, sheet_urls, app, individu
         sheet_values = combined_sheet.get_all_values()
         if not sheet_values:
             combined_sheet.append_row(headers)
-            time.sleep(1.2)  # Add delay after header creation
             
         # Get current date
         eastern = pytz.timezone('US/Eastern')
@@ -976,7 +2554,7 @@ def update_combined_metrics_sheet(rate_limited_client, sheet_urls, app, individu
         
         # Request account summary to refresh data
         app.request_account_summary()
-        time.sleep(3)  # Wait for data to arrive
+        app.wait_for_account_summary(timeout=3)  # Returns as soon as the data arrives
         
         # Extract NAV and cash values from account data
         for account, details in app.account_summary.items():
@@ -1003,9 +2581,11 @@ def update_combined_metrics_sheet(rate_limited_client, sheet_urls, app, individu
         # Add the row to the sheet
         combined_sheet.append_row(row_data)
         print(f"Updated Combined Metrics sheet with data for {current_date}")
+        return True
         
     except Exception as e:
         print(f"Error updating Combined Metrics sheet: {str(e)}")
+        return False
 
 
 def calculate_adjusted_close(data, ticker):
@@ -1209,12 +2789,97 @@ def calculate_adjusted_close(data, ticker):
     
 #     return metrics
 
+# Strategies with at least this many rows today use the NumPy path in calculate_strategy_metrics
+VECTORIZED_METRICS_MIN_ROWS = 256
+
+
+def _strategy_trade_totals(today_rows, tracker_positions, trade_results, ticker_abs_shares_all):
+    """Single pass over today's rows: positions after trading, commission split and cash change"""
+    # Start from existing positions in the tracker, then overlay today's targets
+    all_positions = {ticker: position for ticker, position in tracker_positions.items() if position != 0}
+    strategy_ticker_abs_shares = {}
+    rows_per_ticker = {}
+    trade_cash = 0
+    
+    for row in today_rows:
+        ticker = row['ticker']
+        delta = row['target_position'] - row['pre_trade_position']
+        all_positions[ticker] = row['target_position']
+        strategy_ticker_abs_shares[ticker] = abs(delta)
+        rows_per_ticker[ticker] = rows_per_ticker.get(ticker, 0) + 1
+        if ticker in trade_results:
+            trade_cash -= delta * trade_results[ticker].get('price', 0)
+            
+    # Distribute commission based on proportion of absolute shares traded
+    ticker_commission = {}
+    for ticker, strategy_abs_shares in strategy_ticker_abs_shares.items():
+        if ticker in trade_results and ticker_abs_shares_all.get(ticker, 0) > 0:
+            total_ticker_commission = trade_results[ticker].get('commission', 0)
+            ticker_commission[ticker] = (strategy_abs_shares / ticker_abs_shares_all[ticker]) * total_ticker_commission
+        else:
+            ticker_commission[ticker] = 0
+        # Commission is charged once per row for the ticker
+        trade_cash -= ticker_commission[ticker] * rows_per_ticker[ticker]
+        
+    return all_positions, ticker_commission, trade_cash
+
+
+def _strategy_trade_totals_vectorized(today_rows, tracker_positions, trade_results, ticker_abs_shares_all):
+    """NumPy version of _strategy_trade_totals for strategies carrying thousands of names"""
+    tickers = [row['ticker'] for row in today_rows]
+    targets = [row['target_position'] for row in today_rows]
+    pre_trade = np.array([row['pre_trade_position'] for row in today_rows])
+    deltas = np.array(targets) - pre_trade
+    prices = np.array([trade_results[t].get('price', 0) if t in trade_results else 0 for t in tickers], dtype=float)
+    
+    all_positions = {ticker: position for ticker, position in tracker_positions.items() if position != 0}
+    all_positions.update(zip(tickers, targets))
+    
+    # Last row for a ticker wins, as in the scalar version
+    strategy_ticker_abs_shares = dict(zip(tickers, np.abs(deltas).tolist()))
+    ticker_commission = {}
+    for ticker, strategy_abs_shares in strategy_ticker_abs_shares.items():
+        if ticker in trade_results and ticker_abs_shares_all.get(ticker, 0) > 0:
+            total_ticker_commission = trade_results[ticker].get('commission', 0)
+            ticker_commission[ticker] = (strategy_abs_shares / ticker_abs_shares_all[ticker]) * total_ticker_commission
+        else:
+            ticker_commission[ticker] = 0
+    row_commissions = np.array([ticker_commission[t] for t in tickers], dtype=float)
+    
+    trade_cash = -float(np.dot(deltas, prices)) - float(row_commissions.sum())
+    return all_positions, ticker_commission, trade_cash
+
+
+def _portfolio_market_value(all_positions, trade_results, ticker_prices, vectorized=False):
+    """Sum of position x price, preferring today's fill price over the Yahoo close"""
+    def price_for(ticker):
+        price = 0
+        if ticker in trade_results:
+            price = trade_results[ticker].get('price', 0)
+        if price == 0 and ticker_prices.get(ticker) is not None:
+            price = ticker_prices[ticker]
+        return price
+        
+    if vectorized:
+        positions = np.array(list(all_positions.values()), dtype=float)
+        prices = np.array([price_for(ticker) for ticker in all_positions], dtype=float)
+        return float(np.dot(positions, prices))
+        
+    return sum(position * price_for(ticker) for ticker, position in all_positions.items() if position != 0)
+
+
 def calculate_strategy_metrics(db_handler, strategy_sheet_data, trade_results, individual_trackers, 
-                              strategy_idx, ticker_abs_shares_all=None):
-    """Calculate metrics for an individual strategy with improved NAV calculation"""
+                              strategy_idx, ticker_abs_shares_all=None, vectorized=None, price_provider=None):
+    """Calculate metrics for an individual strategy with improved NAV calculation
+    
+    Today's rows are filtered once and aggregated in a single pass. vectorized=True forces
+    the NumPy path, False the pure-Python one; None picks by the number of rows.
+    price_provider overrides where non-traded prices come from (Yahoo via the local store by default).
+    """
     
     # Get individual tracker for this strategy
     tracker = individual_trackers[strategy_idx]
+    ticker_abs_shares_all = ticker_abs_shares_all or {}
     
     # Get latest cash value from database or use initial $100,000
     initial_cash = 100000
@@ -1226,61 +2891,17 @@ def calculate_strategy_metrics(db_handler, strategy_sheet_data, trade_results, i
     eastern = pytz.timezone('US/Eastern')
     current_date = datetime.datetime.now(eastern).strftime("%Y-%m-%d")
 
-    # Get tickers in this strategy for current date
-    tickers_in_strategy = []
-    for row in strategy_sheet_data:
-        # Standardize the date for comparison
-        row_date = standardize_date_format(row['date'])
-        if row_date == current_date:
-            tickers_in_strategy.append(row['ticker'])
-
-    # Get all current positions including those that haven't changed
-    all_positions = {}
-    
-    # First add positions from tracker (these are existing positions)
-    for ticker, position in tracker.positions.items():
-        if position != 0:
-            all_positions[ticker] = position
-    
-    # Then update with target positions from today's trades
-    for row in strategy_sheet_data:
-        row_date = standardize_date_format(row['date'])
-        if row_date == current_date:
-            ticker = row['ticker']
-            all_positions[ticker] = row['target_position']
-
-    # Calculate absolute shares for this strategy
-    strategy_ticker_abs_shares = {}
-    for row in strategy_sheet_data:
-        row_date = standardize_date_format(row['date'])
-        if row_date == current_date:
-            ticker = row['ticker']
-            delta = row['target_position'] - row['pre_trade_position']
-            abs_shares = abs(delta)
-            strategy_ticker_abs_shares[ticker] = abs_shares
-
-    # Distribute commission based on proportion of absolute shares traded
-    ticker_commission = {}
-    for ticker, strategy_abs_shares in strategy_ticker_abs_shares.items():
-        if ticker in trade_results and ticker in ticker_abs_shares_all and ticker_abs_shares_all[ticker] > 0:
-            total_ticker_commission = trade_results.get(ticker, {}).get('commission', 0)
-            ticker_commission[ticker] = (strategy_abs_shares / ticker_abs_shares_all[ticker]) * total_ticker_commission
-        else:
-            ticker_commission[ticker] = 0
-
-    # Calculate cash after all trades
-    cash_after_trades = initial_cash
-    for row in strategy_sheet_data:
-        row_date = standardize_date_format(row['date'])
-        if row_date == current_date:
-            ticker = row['ticker']
-            delta = row['target_position'] - row['pre_trade_position']
-            price = 0
-            if ticker in trade_results:
-                price = trade_results[ticker].get('price', 0)
-            cash_after_trades -= delta * price
-            if ticker in ticker_commission:
-                cash_after_trades -= ticker_commission[ticker]
+    # Rows for the current date, standardized once
+    today_rows = [row for row in strategy_sheet_data if standardize_date_format(row['date']) == current_date]
+    if vectorized is None:
+        vectorized = len(today_rows) >= VECTORIZED_METRICS_MIN_ROWS
+        
+    if vectorized and today_rows:
+        totals = _strategy_trade_totals_vectorized(today_rows, tracker.positions, trade_results, ticker_abs_shares_all)
+    else:
+        totals = _strategy_trade_totals(today_rows, tracker.positions, trade_results, ticker_abs_shares_all)
+    all_positions, ticker_commission, trade_cash = totals
+    cash_after_trades = initial_cash + trade_cash
 
     # Check if we have no positions after today's trades
     no_positions = len(all_positions) == 0 or all(pos == 0 for pos in all_positions.values())
@@ -1307,32 +2928,17 @@ def calculate_strategy_metrics(db_handler, strategy_sheet_data, trade_results, i
 
     # Get prices for all tickers in the portfolio using Yahoo Finance
     all_tickers = list(all_positions.keys())
-    ticker_prices = fetch_adjusted_closing_prices(all_tickers, current_date)
+    ticker_prices = fetch_adjusted_closing_prices(all_tickers, current_date, store=db_handler, provider=price_provider)
 
     # Calculate NAV = Cash + (Position × Price) for ALL tickers in the portfolio
-    nav = cash_after_trades
-    for ticker, position in all_positions.items():
-        if position == 0:
-            continue  # Skip tickers with zero position
-        
-        # First try to get price from today's trades
-        price = 0
-        if ticker in trade_results:
-            price = trade_results[ticker].get('price', 0)
-        
-        # If not traded today, use adjusted closing price from Yahoo Finance
-        if price == 0 and ticker in ticker_prices and ticker_prices[ticker] is not None:
-            price = ticker_prices[ticker]
-        
-        # Add position value to NAV
-        nav += position * price
+    nav = cash_after_trades + _portfolio_market_value(all_positions, trade_results, ticker_prices, vectorized)
 
     # Prepare metrics for each ticker
     metrics = {}
     
     # If we have no trades today but have positions, create metrics entries
     # for all positions using yahoo prices
-    if not tickers_in_strategy and all_positions:
+    if not today_rows and all_positions:
         for ticker, position in all_positions.items():
             price = 0
             if ticker in ticker_prices and ticker_prices[ticker] is not None:
@@ -1349,29 +2955,27 @@ def calculate_strategy_metrics(db_handler, strategy_sheet_data, trade_results, i
             }
     else:
         # Normal case - we have trades today
-        for row in strategy_sheet_data:
-            row_date = standardize_date_format(row['date'])
-            if row_date == current_date:
-                ticker = row['ticker']
-                pre_trade_position = row['pre_trade_position']
-                target_position = row['target_position']
-                
-                price = 0
-                delta_shares = target_position - pre_trade_position
-                if ticker in trade_results:
-                    price = trade_results[ticker].get('price', 0)
-                elif ticker in ticker_prices and ticker_prices[ticker] is not None:
-                    price = ticker_prices[ticker]
-                
-                metrics[ticker] = {
-                    'pre_trade_position': pre_trade_position,
-                    'post_trade_position': target_position,
-                    'price': price,
-                    'delta_shares': delta_shares,
-                    'commission': ticker_commission.get(ticker, 0),
-                    'cash': cash_after_trades,
-                    'nav': nav
-                }
+        for row in today_rows:
+            ticker = row['ticker']
+            pre_trade_position = row['pre_trade_position']
+            target_position = row['target_position']
+            
+            price = 0
+            delta_shares = target_position - pre_trade_position
+            if ticker in trade_results:
+                price = trade_results[ticker].get('price', 0)
+            elif ticker in ticker_prices and ticker_prices[ticker] is not None:
+                price = ticker_prices[ticker]
+            
+            metrics[ticker] = {
+                'pre_trade_position': pre_trade_position,
+                'post_trade_position': target_position,
+                'price': price,
+                'delta_shares': delta_shares,
+                'commission': ticker_commission.get(ticker, 0),
+                'cash': cash_after_trades,
+                'nav': nav
+            }
 
     # Store cash for next day
     db_handler.store_strategy_cash(strategy_idx, current_date, cash_after_trades)
@@ -1383,7 +2987,27 @@ def calculate_strategy_metrics(db_handler, strategy_sheet_data, trade_results, i
 
 
 
-def combine_positions_from_sheets(rate_limited_client, sheet_urls, individual_trackers=None):
+def fetch_strategy_sheets(rate_limited_client, sheet_urls, max_workers=None):
+    """
+    Read every strategy input sheet concurrently.
+    Concurrency is bounded by the read bucket's burst size, so the pool never
+    has more requests in flight than the rate limiter would let through.
+    Returns a list of (worksheet, data, error) tuples in the same order as sheet_urls.
+    """
+    if not sheet_urls:
+        return []
+    if max_workers is None:
+        max_workers = int(rate_limited_client.buckets['read'].capacity)
+    max_workers = max(1, min(max_workers, len(sheet_urls)))
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda url: connect_to_google_sheets(rate_limited_client, sheet_url=url),
+            sheet_urls
+        ))
+
+
+def combine_positions_from_sheets(rate_limited_client, sheet_urls, individual_trackers=None, max_workers=None):
     combined_positions = {}
     individual_sheet_data = []
     
@@ -1394,8 +3018,10 @@ def combine_positions_from_sheets(rate_limited_client, sheet_urls, individual_tr
     # Create a mapping of tickers to strategies where they appear
     ticker_strategy_map = {}
     
-    for i, url in enumerate(sheet_urls):
-        worksheet, data, error = connect_to_google_sheets(rate_limited_client, sheet_url=url)
+    # Fetch all sheets in parallel, then combine them in strategy order
+    sheet_results = fetch_strategy_sheets(rate_limited_client, sheet_urls, max_workers)
+    
+    for i, (worksheet, data, error) in enumerate(sheet_results):
         
         if error:
             print(f"Error reading sheet {i+1}: {error}")
@@ -1482,8 +3108,32 @@ def combine_positions_from_sheets(rate_limited_client, sheet_urls, individual_tr
     return result, individual_sheet_data, ticker_strategy_map
 
 
-def execute_all_orders(app, combined_data, position_tracker, current_date,individual_trackers):
-    orders_info = []
+# Orders are submitted from a small pool. The Web API client overlaps its contract lookups and HTTP
+# round trips; the TWS client keeps placeOrder serial under order_id_lock (ids must arrive in
+# increasing order), so there the pool only overlaps building the orders
+ORDER_SUBMIT_WORKERS = 8
+
+
+def submit_orders_concurrently(app, order_plans, max_workers=None):
+    """
+    Place the planned orders with bounded parallelism.
+    Returns one future per plan (same order), each resolving to the order_id or None.
+    """
+    if not order_plans:
+        return []
+    workers = max(1, min(max_workers or ORDER_SUBMIT_WORKERS, len(order_plans)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        return [executor.submit(app.place_order, plan['action'], plan['quantity'], plan['ticker'])
+                for plan in order_plans]
+    finally:
+        # Don't wait here; callers collect results from the futures
+        executor.shutdown(wait=False)
+
+
+def plan_orders(combined_data, position_tracker, current_date, individual_trackers):
+    """Work out today's orders (target changes first, then liquidations) without placing them"""
+    order_plans = []
     
     # Get all tickers currently in the portfolio with non-zero positions
     current_portfolio_tickers = {ticker for ticker, position in position_tracker.positions.items() 
@@ -1518,29 +3168,16 @@ def execute_all_orders(app, combined_data, position_tracker, current_date,indivi
         
         print(f"Placing order {i+1}: {action} {quantity} {ticker}")
         
-        try:
-            order_id = app.place_order(action, quantity, ticker)
-            
-            if order_id is None:
-                print(f" - Failed to place order")
-                continue
-                
-            # Store order information for later processing
-            orders_info.append({
-                'order_id': order_id,
-                'ticker': ticker,
-                'action': action,
-                'quantity': quantity,
-                'pre_trade_position': pre_trade_position,
-                'delta_shares': delta_shares,
-                'trade_date': trade_date,
-                'strategy_indices': strategy_indices
-            })
-            
-            print(f" - Order {order_id} placed successfully")
-            
-        except Exception as e:
-            print(f" - Error placing order: {str(e)}")
+        order_plans.append({
+            'ticker': ticker,
+            'action': action,
+            'quantity': quantity,
+            'pre_trade_position': pre_trade_position,
+            'delta_shares': delta_shares,
+            'trade_date': trade_date,
+            'strategy_indices': strategy_indices,
+            'kind': 'order'
+        })
     
     # Liquidate positions for tickers not in today's input sheet
     tickers_to_liquidate = current_portfolio_tickers - today_tickers
@@ -1565,33 +3202,141 @@ def execute_all_orders(app, combined_data, position_tracker, current_date,indivi
         
         print(f"Liquidating position {j+1}: {action} {quantity} {ticker} (Strategies: {strategy_indices})")
         
+        order_plans.append({
+            'ticker': ticker,
+            'action': action,
+            'quantity': quantity,
+            'pre_trade_position': pre_trade_position,
+            'delta_shares': delta_shares,
+            'trade_date': current_date,  # Use current date for liquidation orders
+            'strategy_indices': strategy_indices,  # Include strategies with positions
+            'kind': 'liquidation order'
+        })
+    
+    return order_plans
+
+
+def execute_all_orders(app, combined_data, position_tracker, current_date,individual_trackers, max_workers=None):
+    order_plans = plan_orders(combined_data, position_tracker, current_date, individual_trackers)
+    
+    # Submit the whole basket concurrently and collect results in plan order
+    futures = submit_orders_concurrently(app, order_plans, max_workers)
+    return collect_orders_info(order_plans, futures)
+
+
+def collect_orders_info(order_plans, results):
+    """Build orders_info from the plans and their submission results (futures or order ids)"""
+    orders_info = []
+    for plan, result in zip(order_plans, results):
         try:
-            order_id = app.place_order(action, quantity, ticker)
-            
-            if order_id is None:
-                print(f" - Failed to place liquidation order")
-                continue
-                
-            # Store order information for later processing
-            orders_info.append({
-                'order_id': order_id,
-                'ticker': ticker,
-                'action': action,
-                'quantity': quantity,
-                'pre_trade_position': pre_trade_position,
-                'delta_shares': delta_shares,
-                'trade_date': current_date,  # Use current date for liquidation orders
-                'strategy_indices': strategy_indices  # Include strategies with positions
-            })
+            order_id = result.result() if hasattr(result, 'result') else result
+            if isinstance(order_id, Exception):
+                raise order_id
+        except Exception as e:
+            print(f" - Error placing {plan['kind']} for {plan['ticker']}: {str(e)}")
+            continue
             
-            print(f" - Liquidation order {order_id} placed successfully")
+        if order_id is None:
+            print(f" - Failed to place {plan['kind']} for {plan['ticker']}")
+            continue
             
-        except Exception as e:
-            print(f" - Error placing liquidation order: {str(e)}")
+        # Store order information for later processing
+        orders_info.append({
+            'order_id': order_id,
+            'ticker': plan['ticker'],
+            'action': plan['action'],
+            'quantity': plan['quantity'],
+            'pre_trade_position': plan['pre_trade_position'],
+            'delta_shares': plan['delta_shares'],
+            'trade_date': plan['trade_date'],
+            'strategy_indices': plan['strategy_indices']
+        })
+        
+        print(f" - {plan['kind'].capitalize()} {order_id} placed successfully ({plan['ticker']})")
     
     return orders_info
 
 
+# Drives placement, fill waiting, account refresh and sheet I/O as coroutines on one event loop.
+# Blocking broker/gspread calls run on a bounded executor instead of one sleeping thread each.
+class AsyncExecutionEngine:
+    def __init__(self, app, max_concurrency=ORDER_SUBMIT_WORKERS, executor=None):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def run_blocking(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def gather_blocking(self, calls):
+        """Run [(func, args, kwargs), ...] concurrently; exceptions are returned, not raised"""
+        return await asyncio.gather(*(self.run_blocking(func, *args, **kwargs) for func, args, kwargs in calls),
+                                    return_exceptions=True)
+
+    async def place_orders(self, order_plans):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def place(plan):
+            async with semaphore:
+                return await self.run_blocking(self.app.place_order, plan['action'], plan['quantity'], plan['ticker'])
+                
+        results = await asyncio.gather(*(place(plan) for plan in order_plans), return_exceptions=True)
+        return collect_orders_info(order_plans, results)
+
+    async def wait_for_fills(self, order_ids, timeout=None):
+        """Await order completion without blocking a thread; returns the order_ids still pending"""
+        poller = getattr(self.app, 'start_order_poller', None)
+        if poller:
+            poller()
+        try:
+            return await self.app.fill_tracker.wait_for_fills_async(order_ids, timeout)
+        finally:
+            if poller:
+                await self.run_blocking(self.app.stop_order_poller)
+                await self.run_blocking(self.app.poll_orders)
+
+    async def refresh_account_summary(self, timeout=3):
+        await self.run_blocking(self.app.request_account_summary)
+        return await self.run_blocking(self.app.wait_for_account_summary, timeout)
+
+    async def execute(self, combined_data, position_tracker, current_date, individual_trackers,
+                      individual_sheet_data, ticker_strategy_map, db_handler, output_worksheet=None,
+                      detail_worksheet=None, fill_timeout=600):
+        """Async counterpart of execute_all_orders + retrieve_order_details; returns (results, trade_results)
+        
+        Also exports today's trades to detail_worksheet, concurrently with the output sheet confirmations.
+        """
+        order_plans = plan_orders(combined_data, position_tracker, current_date, individual_trackers)
+        orders_info = await self.place_orders(order_plans)
+        if not orders_info:
+            print("No orders were executed")
+            return [], {}
+            
+        pending = await self.wait_for_fills([order_data['order_id'] for order_data in orders_info], fill_timeout)
+        if pending:
+            print(f"Timed out waiting for {len(pending)} order(s): {pending}")
+        await self.refresh_account_summary()
+        
+        # One executor call for the whole unit of work: its queue is per thread
+        results, trade_results, confirmations = await self.run_blocking(
+            record_order_results, self.app, orders_info, position_tracker, individual_trackers,
+            individual_sheet_data, db_handler
+        )
+        
+        # Sheet writes only after the commit, as separate tasks
+        calls = [(write_trade_confirmations, (output_worksheet, confirmations), {})]
+        if detail_worksheet:
+            calls.append((db_handler.export_to_sheet, (detail_worksheet,), {}))
+        for (func, _, _), outcome in zip(calls, await self.gather_blocking(calls)):
+            if isinstance(outcome, Exception):
+                print(f"Error in {func.__name__}: {outcome}")
+        return results, trade_results
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
 def add_liquidation_rows_to_individual_data(individual_trackers, individual_sheet_data, current_date):
     """
     For each strategy, add a liquidation row for any ticker that was held yesterday but is not in today's input.
@@ -1800,179 +3545,208 @@ def add_liquidation_rows_to_individual_data(individual_trackers, individual_shee
 #     return results, trade_results
 def retrieve_order_details(app, orders_info, position_tracker, individual_trackers,
                            individual_sheet_data, ticker_strategy_map, db_handler,
-                           output_worksheet=None):
-    results = []
-    trade_results = {}
-    
+                           output_worksheet=None, wait_minutes=10):
     if not orders_info:
         print("No orders were executed")
-        return results, trade_results
+        return [], {}
     
-    # Wait for processing time
-    wait_minutes = 10
-    print(f"All orders placed. Waiting {wait_minutes} minutes before retrieving details...")
-    time.sleep(wait_minutes * 60)
+    # Wait until every order is done (fills and commission reports in), up to the old fixed wait
+    print(f"All orders placed. Waiting up to {wait_minutes} minutes for fills...")
+    pending = app.wait_for_fills([order_data['order_id'] for order_data in orders_info],
+                                 timeout=wait_minutes * 60)
+    if pending:
+        print(f"Timed out waiting for {len(pending)} order(s): {pending}")
     
     # Request account summary to refresh data
     app.request_account_summary()
-    time.sleep(3)  # Wait a few seconds for data to arrive
-    
-    # Process each order's details
-    for order_data in orders_info:
-        order_id = order_data['order_id']
-        ticker = order_data['ticker']
-        action = order_data['action']
-        quantity = order_data['quantity']
-        pre_trade_position = order_data['pre_trade_position']
-        delta_shares = order_data['delta_shares']
-        trade_date = order_data['trade_date']
-        strategy_indices = order_data['strategy_indices']
-        
-        print(f"Retrieving details for order {order_id}: {action} {quantity} {ticker}")
-        
-        # Collect execution details
-        status = 'Unknown'
-        price = 0
-        commission = 0
+    app.wait_for_account_summary(timeout=3)  # Returns as soon as the data arrives
+    
+    results, trade_results, confirmations = record_order_results(
+        app, orders_info, position_tracker, individual_trackers, individual_sheet_data, db_handler
+    )
+    
+    # Sheets only after the commit, so a slow or failing append can't hold up or undo recorded trades
+    write_trade_confirmations(output_worksheet, confirmations)
+    return results, trade_results
+
+
+def record_order_results(app, orders_info, position_tracker, individual_trackers, individual_sheet_data, db_handler):
+    """Record every order's trade and position changes in one unit of work.
+    Returns (results, trade_results, confirmation rows for the output sheet)."""
+    results = []
+    trade_results = {}
+    confirmations = []
+    
+    # Trades and the position events they cause are committed in one transaction when the loop
+    # finishes, so the trades table and the position log can never disagree
+    trade_rows = []
+    with db_handler.unit_of_work():
+    
+        # Process each order's details
+        for order_data in orders_info:
+            order_id = order_data['order_id']
+            ticker = order_data['ticker']
+            action = order_data['action']
+            quantity = order_data['quantity']
+            pre_trade_position = order_data['pre_trade_position']
+            delta_shares = order_data['delta_shares']
+            trade_date = order_data['trade_date']
+            strategy_indices = order_data['strategy_indices']
+        
+            print(f"Retrieving details for order {order_id}: {action} {quantity} {ticker}")
+        
+            # Collect execution details
+            status = 'Unknown'
+            price = 0
+            commission = 0
         
-        if order_id in app.order_status:
-            status = app.order_status[order_id]['status']
-            price = app.order_status[order_id].get('avgFillPrice', 0)
+            if order_id in app.order_status:
+                status = app.order_status[order_id]['status']
+                price = app.order_status[order_id].get('avgFillPrice', 0)
             
-            # If price is empty string, convert to 0
-            if price == '':
-                price = 0
+                # If price is empty string, convert to 0
+                if price == '':
+                    price = 0
                 
-            # Check for execution details
-            if order_id in app.execution_details:
-                exec_id = app.execution_details[order_id].get('execId')
+                # Aggregate every partial fill of the order, not just the last execution
+                fills = app.execution_ledger.summary(order_id)
+                if fills:
+                    # Fall back to the VWAP over all fills if order status has no average price
+                    if price == 0:
+                        price = fills['avg_price']
+                    commission = fills['commission']
+        
+            # Add detailed logging for debugging            
+            print(f" - Order {order_id} status: {status}, price: {price}, commission: {commission}")
+            fills = app.execution_ledger.summary(order_id)
+            print(f" - Execution details available: {fills is not None}")
+            if fills:
+                print(f" - Fills: {fills['fills']}, shares: {fills['shares']}, VWAP: {fills['avg_price']}")
                 
-                # Try to get price from execution details if not available from order status
-                if price == 0 and 'price' in app.execution_details[order_id]:
-                    price = app.execution_details[order_id]['price']
-                    
-                if exec_id and exec_id in app.commission_details:
-                    commission = app.commission_details[exec_id].get('commission', 0)
-                    if commission == '':
-                        commission = 0
-        
-        # Add detailed logging for debugging            
-        print(f" - Order {order_id} status: {status}, price: {price}, commission: {commission}")
-        print(f" - Execution details available: {order_id in app.execution_details}")
-        if order_id in app.execution_details:
-            print(f" - Execution ID: {app.execution_details[order_id].get('execId')}")
-            print(f" - Commission details available: {app.execution_details[order_id].get('execId') in app.commission_details}")
-                
-        # Get account summary data
-        nav = 0
-        interest = 0
-        
-        for account, details in app.account_summary.items():
-            if 'NetLiquidation' in details:
-                nav_val = details['NetLiquidation'].get('value', '')
-                nav = float(nav_val) if nav_val and nav_val != '' else 0
-            if 'AccruedCash' in details:
-                interest_val = details['AccruedCash'].get('value', '')
-                interest = float(interest_val) if interest_val and interest_val != '' else 0
-                
-        is_executed = status in ['Filled', 'Submitted', 'PreSubmitted']
-        
-        # Store trade information for updating input sheets later
-        trade_results[ticker] = {
-            'price': price if price else 0,
-            'status': status,
-            'delta_shares': delta_shares if is_executed else 0,
-            'individual_deltas': [],  # Will store individual strategy deltas
-            'commission': commission  # Add commission to trade results
-        }
+            # Get account summary data
+            nav = 0
+            interest = 0
+        
+            for account, details in app.account_summary.items():
+                if 'NetLiquidation' in details:
+                    nav_val = details['NetLiquidation'].get('value', '')
+                    nav = float(nav_val) if nav_val and nav_val != '' else 0
+                if 'AccruedCash' in details:
+                    interest_val = details['AccruedCash'].get('value', '')
+                    interest = float(interest_val) if interest_val and interest_val != '' else 0
+                
+            is_executed = status in ['Filled', 'Submitted', 'PreSubmitted']
+        
+            # Store trade information for updating input sheets later
+            trade_results[ticker] = {
+                'price': price if price else 0,
+                'status': status,
+                'delta_shares': delta_shares if is_executed else 0,
+                'individual_deltas': [],  # Will store individual strategy deltas
+                'commission': commission  # Add commission to trade results
+            }
         
-        # After collecting execution details
-        if is_executed:
-            # Save to SQLite database
-            trade_data = [
-                trade_date,
-                ticker,
-                float(delta_shares),  # Net Units
-                float(abs(delta_shares)),  # Total Abs Units
-                float(price),
-                float(price),  # Using trade price as Adj Close
-                action,
-                float(pre_trade_position),
-                float(delta_shares),
-                float(pre_trade_position + delta_shares),  # Post-trade position
-                float(commission),
-                float(interest),
-                float(nav)
-            ]
+            # After collecting execution details
+            if is_executed:
+                # Save to SQLite database
+                trade_data = [
+                    trade_date,
+                    ticker,
+                    float(delta_shares),  # Net Units
+                    float(abs(delta_shares)),  # Total Abs Units
+                    float(price),
+                    float(price),  # Using trade price as Adj Close
+                    action,
+                    float(pre_trade_position),
+                    float(delta_shares),
+                    float(pre_trade_position + delta_shares),  # Post-trade position
+                    float(commission),
+                    float(interest),
+                    float(nav)
+                ]
+            
+                # Queue for the SQLite insert
+                trade_rows.append(trade_data)
             
-            # Insert into SQLite
-            db_handler.insert_trade(trade_data)
-            
-            # Update combined position
-            position_tracker.update_position(ticker, delta_shares)
-            post_trade_position = position_tracker.get_position(ticker)
-            
-            # Update individual positions ONLY for strategies that include this ticker
-            for strategy_idx in strategy_indices:
-                if strategy_idx < len(individual_trackers) and strategy_idx < len(individual_sheet_data):
-                    # Find the target position for this ticker in this strategy
-                    strategy_target = 0
-                    for row in individual_sheet_data[strategy_idx]:
-                        if row['ticker'] == ticker and row['date'] == trade_date:
-                            strategy_target = row['target_position']
-                            break
+                # Update combined position
+                position_tracker.update_position(ticker, delta_shares, trade_date=trade_date)
+                post_trade_position = position_tracker.get_position(ticker)
+            
+                # Update individual positions ONLY for strategies that include this ticker
+                for strategy_idx in strategy_indices:
+                    if strategy_idx < len(individual_trackers) and strategy_idx < len(individual_sheet_data):
+                        # Find the target position for this ticker in this strategy
+                        strategy_target = 0
+                        for row in individual_sheet_data[strategy_idx]:
+                            if row['ticker'] == ticker and row['date'] == trade_date:
+                                strategy_target = row['target_position']
+                                break
                             
-                    # Get current position for this strategy
-                    indiv_pre_trade = individual_trackers[strategy_idx].get_position(ticker)
+                        # Get current position for this strategy
+                        indiv_pre_trade = individual_trackers[strategy_idx].get_position(ticker)
                     
-                    # Calculate the delta for this strategy
-                    indiv_delta = strategy_target - indiv_pre_trade
+                        # Calculate the delta for this strategy
+                        indiv_delta = strategy_target - indiv_pre_trade
                     
-                    # Only update if there's a position change for this strategy
-                    if indiv_delta != 0:
-                        individual_trackers[strategy_idx].update_position(ticker, indiv_delta)
+                        # Only update if there's a position change for this strategy
+                        if indiv_delta != 0:
+                            individual_trackers[strategy_idx].update_position(ticker, indiv_delta, trade_date=trade_date)
                         
-                    # Store the individual delta for this strategy
-                    trade_results[ticker]['individual_deltas'].append({
-                        'strategy_index': strategy_idx,
-                        'delta': indiv_delta,
-                        'pre_trade': indiv_pre_trade,
-                        'post_trade': individual_trackers[strategy_idx].get_position(ticker)
-                    })
-        else:
-            post_trade_position = pre_trade_position
+                        # Store the individual delta for this strategy
+                        trade_results[ticker]['individual_deltas'].append({
+                            'strategy_index': strategy_idx,
+                            'delta': indiv_delta,
+                            'pre_trade': indiv_pre_trade,
+                            'post_trade': individual_trackers[strategy_idx].get_position(ticker)
+                        })
+            else:
+                post_trade_position = pre_trade_position
             
-        # Update output worksheet (still keep this for immediate trade confirmation)
-        if output_worksheet and is_executed:
-            try:
+            # Trade confirmation for the output sheet, written once the unit has committed
+            if is_executed:
                 # Use US Eastern time for timestamp
                 eastern = pytz.timezone('US/Eastern')
                 current_timestamp = datetime.datetime.now(eastern).strftime("%Y-%m-%d %H:%M:%S")
+                confirmations.append([current_timestamp, ticker, action, quantity, price, status])
                 
-                output_worksheet.append_row([
-                    current_timestamp,
-                    ticker,
-                    action,
-                    quantity,
-                    price,
-                    status
-                ])
-                print(f" - Updated output sheet for order {order_id}")
-            except Exception as e:
-                print(f" - Error updating output sheet: {str(e)}")
-                
-        results.append({
-            'ticker': ticker,
-            'action': action,
-            'quantity': quantity,
-            'status': status,
-            'price': price,
-            'commission': commission
-        })
+            results.append({
+                'ticker': ticker,
+                'action': action,
+                'quantity': quantity,
+                'status': status,
+                'price': price,
+                'commission': commission
+            })
         
-        print(f" - Order {order_id} final status: {status}")
+            print(f" - Order {order_id} final status: {status}")
     
-    return results, trade_results
+        db_handler.insert_trades_bulk(trade_rows)
+    
+    return results, trade_results, confirmations
+
+
+def write_trade_confirmations(output_worksheet, confirmations):
+    """Append the trade confirmation rows to the output sheet in one request"""
+    if not output_worksheet or not confirmations:
+        return False
+    try:
+        output_worksheet.append_rows(confirmations)
+        print(f" - Updated output sheet with {len(confirmations)} trade confirmation(s)")
+        return True
+    except Exception as e:
+        print(f" - Error updating output sheet: {str(e)}")
+        return False
+
+
+# Precompiled fast paths for the date formats that show up in the sheets
+ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+ISO_LOOSE_DATE_RE = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})$')
+US_DATE_RE = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+SHEETS_SERIAL_DATE_RE = re.compile(r'^(\d{5})(?:\.0+)?$')
+SHEETS_EPOCH = datetime.date(1899, 12, 30)  # Google Sheets day 0
+# Only 5-digit numbers that land in 2000-2099 are taken as serial dates; anything else isn't a trade date
+SHEETS_SERIAL_MIN = (datetime.date(2000, 1, 1) - SHEETS_EPOCH).days
+SHEETS_SERIAL_MAX = (datetime.date(2099, 12, 31) - SHEETS_EPOCH).days
 
 
 def standardize_date_format(date_str):
@@ -1986,6 +3760,7 @@ def standardize_date_format(date_str):
     - YYYY/MM/DD
     - YYYY-M-D (without leading zeros)
     - Month DD, YYYY
+    - Google Sheets serial dates (e.g. 45321)
     Returns:
     Standardized YYYY-MM-DD or original string if conversion fails
     """
@@ -1993,20 +3768,41 @@ def standardize_date_format(date_str):
         return date_str
         
     # If already in YYYY-MM-DD format, return as is
-    if re.match(r'^\d{4}-\d{2}-\d{2}$', date_str):
+    if ISO_DATE_RE.match(date_str):
         return date_str
         
+    return _standardize_date_cached(date_str)
+
+
+@lru_cache(maxsize=8192)
+def _standardize_date_cached(date_str):
+    """Memoized conversion; sheets repeat the same few hundred dates on every row"""
     # Handle YYYY-M-D format (without leading zeros)
-    if re.match(r'^\d{4}-\d{1,2}-\d{1,2}$', date_str):
-        try:
-            parts = date_str.split('-')
-            year = int(parts[0])
-            month = int(parts[1])
-            day = int(parts[2])
-            return f"{year:04d}-{month:02d}-{day:02d}"
-        except:
-            pass
-            
+    match = ISO_LOOSE_DATE_RE.match(date_str)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+        return f"{year:04d}-{month:02d}-{day:02d}"
+        
+    # Handle M/D/YYYY, falling back to D/M/YYYY when the month is out of range (as dateutil does)
+    match = US_DATE_RE.match(date_str)
+    if match:
+        first, second, year = (int(part) for part in match.groups())
+        for month, day in ((first, second), (second, first)):
+            try:
+                return datetime.date(year, month, day).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+                
+    # Google Sheets serial date (days since 1899-12-30), within a plausible range
+    match = SHEETS_SERIAL_DATE_RE.match(date_str)
+    if match and SHEETS_SERIAL_MIN <= int(match.group(1)) <= SHEETS_SERIAL_MAX:
+        return (SHEETS_EPOCH + datetime.timedelta(days=int(match.group(1)))).strftime("%Y-%m-%d")
+        
+    return _parse_date_slow(date_str)
+
+
+def _parse_date_slow(date_str):
+    """General-purpose parsing for anything the fast paths don't recognise"""
     try:
         # Try with dateutil parser (handles most formats)
         parsed_date = parser.parse(date_str, dayfirst=False)
@@ -2206,21 +4002,40 @@ def update_input_sheets(credentials_file, sheet_urls, trade_results, ticker_stra
 
 
 def update_input_sheets_with_rate_limiting(rate_limited_client, sheet_urls, trade_results, ticker_strategy_map,
-                                         individual_sheet_data, individual_trackers, db_handler, ticker_abs_shares_all):
-    """Update input sheets with batched API requests using rate limiting."""
+                                         individual_sheet_data, individual_trackers, db_handler, ticker_abs_shares_all,
+                                         write_coalescer=None, price_provider=None, strategy_indices=None):
+    """Update input sheets with batched API requests using rate limiting.
+    
+    All writes for a strategy spreadsheet are collected in a SheetWriteCoalescer and sent
+    as one values:batchUpdate per spreadsheet. If the caller passes its own coalescer,
+    flushing it is left to the caller. price_provider is passed to calculate_strategy_metrics.
+    strategy_indices limits the update to those strategies (all of them by default).
+    Returns False if any strategy could not be updated; a failed flush raises.
+    """
+    coalescer = write_coalescer if write_coalescer is not None else SheetWriteCoalescer()
+    failed_strategies = []
+    
+    # One price download for all strategies; calculate_strategy_metrics then reads from the cache
+    eastern = pytz.timezone('US/Eastern')
+    prefetch_closing_prices(individual_sheet_data, individual_trackers,
+                            datetime.datetime.now(eastern).strftime("%Y-%m-%d"), store=db_handler,
+                            provider=price_provider)
+    
     # Update each strategy sheet
     for i, url in enumerate(sheet_urls):
+        if strategy_indices is not None and i not in strategy_indices:
+            continue
         try:
-            # Open spreadsheet by URL
+            # Open spreadsheet by URL and pull every tab in a single batchGet
             spreadsheet = rate_limited_client.open_by_url(url)
+            snapshot = load_spreadsheet_snapshot(rate_limited_client, url)
+            write_buffer = coalescer.buffer_for(spreadsheet)
             
             # Get or create detail worksheet (2nd sheet)
-            try:
-                detail_worksheet = spreadsheet.get_worksheet(1)
-                if not detail_worksheet:
-                    detail_worksheet = spreadsheet.add_worksheet(title="Trade Details", rows=1000, cols=20)
-            except:
-                detail_worksheet = spreadsheet.add_worksheet(title="Trade Details", rows=1000, cols=20)
+            detail_worksheet = snapshot.worksheet(1)
+            if not detail_worksheet:
+                detail_worksheet = rate_limited_client.add_worksheet(spreadsheet, "Trade Details", rows=1000, cols=20)
+                snapshot.add_tab(detail_worksheet)
                 
             # Define headers for detail worksheet
             detail_headers = [
@@ -2230,10 +4045,10 @@ def update_input_sheets_with_rate_limiting(rate_limited_client, sheet_urls, trad
             ]
             
             # Check if headers exist
-            detail_values = detail_worksheet.get_all_values()
+            detail_values = snapshot.values(detail_worksheet.title)
             if not detail_values:
-                detail_worksheet.append_row(detail_headers)
-                time.sleep(1.2)  # Add delay after header creation
+                write_buffer.add_row(detail_worksheet, 1, detail_headers)
+                detail_values = [detail_headers]
                 
             # Calculate metrics for this strategy
             metrics = calculate_strategy_metrics(
@@ -2242,7 +4057,8 @@ def update_input_sheets_with_rate_limiting(rate_limited_client, sheet_urls, trad
                 trade_results,
                 individual_trackers,
                 i,
-                ticker_abs_shares_all
+                ticker_abs_shares_all,
+                price_provider=price_provider
             )
             
             # Get current date and timestamp
@@ -2253,9 +4069,6 @@ def update_input_sheets_with_rate_limiting(rate_limited_client, sheet_urls, trad
             # Store NAV for later use with Daily NAV sheet
             strategy_nav = 0
             
-            # Prepare batch updates for detail worksheet
-            detail_batch_updates = []
-            
             # Prepare batch updates for first sheet
             first_sheet_updates = []
             
@@ -2291,11 +4104,8 @@ def update_input_sheets_with_rate_limiting(rate_limited_client, sheet_urls, trad
                     ticker_metrics['cash']
                 ]
                 
-                # Add to batch updates for detail worksheet
-                detail_batch_updates.append({
-                    'range': f'A{row_to_add}:N{row_to_add}',
-                    'values': [detail_row]
-                })
+                # Queue the detail worksheet row
+                write_buffer.add_row(detail_worksheet, row_to_add, detail_row)
                 row_to_add += 1
                 
                 # Store strategy NAV from the first ticker (they're all the same)
@@ -2323,41 +4133,55 @@ def update_input_sheets_with_rate_limiting(rate_limited_client, sheet_urls, trad
                     'nav': ticker_metrics['nav']
                 })
                 
-            # Execute batch updates for detail worksheet
-            if detail_batch_updates:
-                # Split into smaller batches if needed
-                for i in range(0, len(detail_batch_updates), 10):  # Reduced batch size to 10
-                    batch_chunk = detail_batch_updates[i:i+10]
-                    retry_with_backoff(detail_worksheet.batch_update, batch_chunk)
-                    time.sleep(1.2)  # Add delay between batches
-                    
             # Update first sheet with batch updates
+            updated = True
             if first_sheet_updates:
-                batch_update_multiple_tickers_with_rate_limiting(rate_limited_client, url, first_sheet_updates)
+                updated = batch_update_multiple_tickers_with_rate_limiting(
+                    rate_limited_client, url, first_sheet_updates, snapshot=snapshot, write_buffer=write_buffer
+                ) and updated
                 
             # Update balance sheet with batch updates
             if balance_sheet_updates:
-                batch_update_balance_sheet_with_rate_limiting(rate_limited_client, url, balance_sheet_updates)
+                updated = batch_update_balance_sheet_with_rate_limiting(
+                    rate_limited_client, url, balance_sheet_updates, snapshot=snapshot, write_buffer=write_buffer
+                ) and updated
                 
             # Update Daily NAV sheet
-            update_daily_nav_sheet_with_rate_limiting(rate_limited_client, url, current_date, strategy_nav)
+            updated = update_daily_nav_sheet_with_rate_limiting(
+                rate_limited_client, url, current_date, strategy_nav, snapshot=snapshot, write_buffer=write_buffer
+            ) and updated
+            
+            if not updated:
+                failed_strategies.append(i + 1)
             
         except Exception as e:
             print(f"Error updating sheet {i+1}: {str(e)}")
+            failed_strategies.append(i + 1)
             continue
+    
+    # One values:batchUpdate per strategy spreadsheet for everything queued above
+    if write_coalescer is None:
+        calls = coalescer.flush_all()
+        print(f"Flushed strategy sheet updates in {calls} batch request(s)")
+        
+    if failed_strategies:
+        print(f"Sheet updates failed for strategies: {failed_strategies}")
+        return False
+    return True
 
 
 def initialize_strategy_cash(db_handler, num_strategies):
     """Initialize cash records for all strategies if not already present"""
-    for strategy_idx in range(num_strategies):
-        previous_cash = db_handler.get_previous_day_cash(strategy_idx)
-        
-        if previous_cash is None:
-            # Initialize with $100,000
-            eastern = pytz.timezone('US/Eastern')
-            current_date = datetime.datetime.now(eastern).strftime("%Y-%m-%d")
-            db_handler.store_strategy_cash(strategy_idx, current_date, 100000)
-            print(f"Initialized strategy {strategy_idx+1} with $100,000 cash")
+    with db_handler.unit_of_work():
+        for strategy_idx in range(num_strategies):
+            previous_cash = db_handler.get_previous_day_cash(strategy_idx)
+            
+            if previous_cash is None:
+                # Initialize with $100,000
+                eastern = pytz.timezone('US/Eastern')
+                current_date = datetime.datetime.now(eastern).strftime("%Y-%m-%d")
+                db_handler.store_strategy_cash(strategy_idx, current_date, 100000)
+                print(f"Initialized strategy {strategy_idx+1} with $100,000 cash")
 
 def initialize_detailed_worksheet(detail_worksheet, headers):
     try:
@@ -2392,15 +4216,19 @@ def retry_with_backoff(func, *args, max_retries=5, initial_delay=1, **kwargs):
 
 
 
-def update_strategy_first_sheet(rate_limited_client, sheet_url, ticker, delta_shares, trade_price, trade_date):
+def update_strategy_first_sheet(rate_limited_client, sheet_url, ticker, delta_shares, trade_price, trade_date, snapshot=None):
     """Update the first sheet of each strategy with trade details using batch updates."""
     try:
-        # Open the spreadsheet
-        spreadsheet = rate_limited_client.open_by_url(sheet_url)
-        first_sheet = spreadsheet.get_worksheet(0)  # Get first worksheet
-        
-        # Find the row with the ticker and date
-        all_values = first_sheet.get_all_values()
+        if snapshot is not None:
+            first_sheet = snapshot.worksheet(0)
+            all_values = snapshot.values(0)
+        else:
+            # Open the spreadsheet
+            spreadsheet = rate_limited_client.open_by_url(sheet_url)
+            first_sheet = rate_limited_client.get_worksheet(spreadsheet, 0)  # Get first worksheet
+            
+            # Find the row with the ticker and date
+            all_values = first_sheet.get_all_values()
         header_row = all_values[0] if all_values else []
         
         # Find columns for Date and Ticker
@@ -2417,15 +4245,11 @@ def update_strategy_first_sheet(rate_limited_client, sheet_url, ticker, delta_sh
                 return
                 
         # Find row with matching date and ticker
-        row_index = None
-        std_trade_date = standardize_date_format(trade_date)
-        
-        for i, row in enumerate(all_values[1:], start=2):  # Start at row 2 (1-indexed)
-            if len(row) > max(date_col, ticker_col):
-                sheet_date = standardize_date_format(row[date_col])
-                if sheet_date == std_trade_date and row[ticker_col] == ticker:
-                    row_index = i
-                    break
+        if snapshot is not None:
+            row_lookup = snapshot.row_index(0, date_col, ticker_col)
+        else:
+            row_lookup = SheetRowIndex(all_values, date_col, ticker_col)
+        row_index = row_lookup.find(trade_date, ticker)
                     
         if not row_index:
             print(f"No match for {ticker} on {trade_date} in sheet: {sheet_url}")
@@ -2583,16 +4407,29 @@ def batch_update_multiple_tickers(credentials_file, sheet_url, updates_data):
         print(f"Error updating sheet: {str(e)}")
 
 
-def batch_update_multiple_tickers_with_rate_limiting(rate_limited_client, sheet_url, updates_data):
-    """Batch update multiple tickers with rate limiting."""
+def batch_update_multiple_tickers_with_rate_limiting(rate_limited_client, sheet_url, updates_data, snapshot=None,
+                                                     write_buffer=None):
+    """Batch update multiple tickers with rate limiting.
+    
+    If a SpreadsheetSnapshot is given, the first sheet is read from it instead of the API.
+    If a SheetWriteBuffer is given, writes are queued on it and the caller flushes them;
+    otherwise they are sent here in a single values:batchUpdate.
+    Returns True on success, False if the sheet could not be read or written.
+    """
     try:
-        # Open the spreadsheet
-        spreadsheet = rate_limited_client.open_by_url(sheet_url)
-        first_sheet = spreadsheet.get_worksheet(0)
-        
-        # Get all values and header row
-        all_values = first_sheet.get_all_values()
+        if snapshot is not None:
+            spreadsheet = snapshot.spreadsheet
+            first_sheet = snapshot.worksheet(0)
+            all_values = snapshot.values(0)
+        else:
+            # Open the spreadsheet
+            spreadsheet = rate_limited_client.open_by_url(sheet_url)
+            first_sheet = rate_limited_client.get_worksheet(spreadsheet, 0)
+            
+            # Get all values and header row
+            all_values = first_sheet.get_all_values()
         header_row = all_values[0] if all_values else []
+        buffer = write_buffer if write_buffer is not None else SheetWriteBuffer(spreadsheet)
         
         # Find columns for Date and Ticker
         date_col = next((i for i, val in enumerate(header_row) if val.lower() == 'date'), -1)
@@ -2607,7 +4444,13 @@ def batch_update_multiple_tickers_with_rate_limiting(rate_limited_client, sheet_
             
             if date_col == -1 or ticker_col == -1:
                 print(f"Could not find Date/Ticker columns in sheet: {sheet_url}")
-                return
+                return False
+                
+        # Build the (date, ticker) -> row lookup once for all updates
+        if snapshot is not None:
+            row_lookup = snapshot.row_index(0, date_col, ticker_col)
+        else:
+            row_lookup = SheetRowIndex(all_values, date_col, ticker_col)
                 
         # Find/create columns for trade details
         shares_col = next((i+1 for i, val in enumerate(header_row)
@@ -2618,17 +4461,12 @@ def batch_update_multiple_tickers_with_rate_limiting(rate_limited_client, sheet_
         # Create columns if needed
         if not shares_col:
             shares_col = len(header_row) + 1
-            first_sheet.update_cell(1, shares_col, "Shares bought/sold")
-            time.sleep(1.2)  # Add delay to avoid rate limits
+            buffer.add_cell(first_sheet, 1, shares_col, "Shares bought/sold")
             
         if not price_col:
             price_col = len(header_row) + 2 if shares_col == len(header_row) + 1 else len(header_row) + 1
-            first_sheet.update_cell(1, price_col, "Price")
-            time.sleep(1.2)  # Add delay to avoid rate limits
+            buffer.add_cell(first_sheet, 1, price_col, "Price")
             
-        # Prepare batch updates
-        batch_updates = []
-        
         # Process each ticker update
         for update in updates_data:
             ticker = update['ticker']
@@ -2636,19 +4474,8 @@ def batch_update_multiple_tickers_with_rate_limiting(rate_limited_client, sheet_
             trade_price = update['trade_price']
             trade_date = update['trade_date']
             
-            # Standardize the trade date for comparison
-            std_trade_date = standardize_date_format(trade_date)
-            
             # Find row with matching date and ticker
-            row_index = None
-            for i, row in enumerate(all_values[1:], start=2):
-                if len(row) > max(date_col, ticker_col):
-                    # Standardize the date from the sheet for comparison
-                    sheet_date = standardize_date_format(row[date_col])
-                    
-                    if sheet_date == std_trade_date and row[ticker_col] == ticker:
-                        row_index = i
-                        break
+            row_index = row_lookup.find(trade_date, ticker)
                     
             # If no row exists, create a new row for this liquidated ticker
             if not row_index:
@@ -2663,41 +4490,30 @@ def batch_update_multiple_tickers_with_rate_limiting(rate_limited_client, sheet_
                 if target_pos_col != -1:
                     new_row[target_pos_col] = 0
                 
-                # Append the new row
-                first_sheet.append_row(new_row)
-                time.sleep(1.2)  # Add delay to avoid rate limits
-                
-                # Get updated values to find the new row index
-                all_values = first_sheet.get_all_values()
+                # Allocate the next free row locally and write it with the other updates
+                all_values.append(new_row)
                 row_index = len(all_values)  # The new row is at the end
+                row_lookup.add(trade_date, ticker, row_index)
+                buffer.add_row(first_sheet, row_index, new_row)
             
-            # Add shares update to batch
-            shares_a1 = gspread.utils.rowcol_to_a1(row_index, shares_col)
-            batch_updates.append({
-                'range': shares_a1,
-                'values': [[delta_shares]]
-            })
-            
-            # Add price update to batch
-            price_a1 = gspread.utils.rowcol_to_a1(row_index, price_col)
-            batch_updates.append({
-                'range': price_a1,
-                'values': [[trade_price]]
-            })
+            # Queue shares and price updates
+            buffer.add_cell(first_sheet, row_index, shares_col, delta_shares)
+            buffer.add_cell(first_sheet, row_index, price_col, trade_price)
             
-        # Execute all updates in smaller batches
-        if batch_updates:
-            for i in range(0, len(batch_updates), 10):  # Process in batches of 10
-                batch_chunk = batch_updates[i:i+10]
-                retry_with_backoff(first_sheet.batch_update, batch_chunk)
-                time.sleep(1.2)  # Add delay between batches
-                
-            print(f"Updated {len(updates_data)} tickers in first sheet")
+        # Send everything in one batchUpdate unless the caller is coalescing writes
+        if updates_data:
+            if write_buffer is None:
+                buffer.flush()
+                print(f"Updated {len(updates_data)} tickers in first sheet")
+            else:
+                print(f"Queued {len(updates_data)} ticker updates for the first sheet")
         else:
             print("No updates to perform")
+        return True
             
     except Exception as e:
         print(f"Error updating sheet: {str(e)}")
+        return False
 
 
 def update_daily_nav_sheet(credentials_file, sheet_url, date, nav):
@@ -2749,52 +4565,60 @@ def update_daily_nav_sheet(credentials_file, sheet_url, date, nav):
         print(f"Error updating Daily NAV sheet: {str(e)}")
 
 
-def update_daily_nav_sheet_with_rate_limiting(rate_limited_client, sheet_url, date, nav):
-    """Create and update a 3rd sheet for tracking daily NAV with rate limiting."""
+def update_daily_nav_sheet_with_rate_limiting(rate_limited_client, sheet_url, date, nav, snapshot=None,
+                                              write_buffer=None):
+    """Create and update a 3rd sheet for tracking daily NAV with rate limiting.
+    
+    If a SpreadsheetSnapshot is given, existing dates are read from it instead of the API.
+    If a SheetWriteBuffer is given, writes are queued on it and the caller flushes them.
+    Returns True on success, False on error.
+    """
     try:
         # Open the spreadsheet
         spreadsheet = rate_limited_client.open_by_url(sheet_url)
         
         # Check if Daily NAV sheet exists, create if not
-        try:
-            nav_sheet = spreadsheet.worksheet("Daily NAV")
-        except:
-            nav_sheet = spreadsheet.add_worksheet(title="Daily NAV", rows=1000, cols=3)
+        if snapshot is not None and snapshot.has("Daily NAV"):
+            nav_sheet = snapshot.worksheet("Daily NAV")
+        else:
+            try:
+                nav_sheet = rate_limited_client.worksheet(spreadsheet, "Daily NAV")
+            except:
+                nav_sheet = rate_limited_client.add_worksheet(spreadsheet, "Daily NAV", rows=1000, cols=3)
+                if snapshot is not None:
+                    snapshot.add_tab(nav_sheet)
             
-        # Add headers in batch
-        header_update = {
-            'range': 'A1:B1',
-            'values': [["Date", "Daily NAV"]]
-        }
+        buffer = write_buffer if write_buffer is not None else SheetWriteBuffer(spreadsheet)
         
-        retry_with_backoff(nav_sheet.batch_update, [header_update])
-        time.sleep(1.2)  # Add delay to avoid rate limits
+        # Add headers in batch
+        buffer.add_row(nav_sheet, 1, ["Date", "Daily NAV"])
         
-        # Check if date already exists in sheet
-        dates = nav_sheet.col_values(1)
+        # Check if date already exists in sheet (the header queued above is always in A1)
+        if snapshot is not None:
+            dates = snapshot.col_values("Daily NAV", 1) or ["Date"]
+        else:
+            dates = nav_sheet.col_values(1) or ["Date"]
         
         # Prepare update
         if date in dates:
             # Update existing row
             row_idx = dates.index(date) + 1  # +1 because sheets are 1-indexed
-            update_data = {
-                'range': f'B{row_idx}',
-                'values': [[nav]]
-            }
+            buffer.add_cell(nav_sheet, row_idx, 2, nav)
         else:
             # Add new row
-            update_data = {
-                'range': f'A{len(dates) + 1}:B{len(dates) + 1}',
-                'values': [[date, nav]]
-            }
+            buffer.add_row(nav_sheet, len(dates) + 1, [date, nav])
             
         # Execute update
-        retry_with_backoff(nav_sheet.batch_update, [update_data])
-        time.sleep(1.2)  # Add explicit delay after update
-        print(f"Updated Daily NAV sheet for {date}")
+        if write_buffer is None:
+            buffer.flush()
+            print(f"Updated Daily NAV sheet for {date}")
+        else:
+            print(f"Queued Daily NAV update for {date}")
+        return True
         
     except Exception as e:
         print(f"Error updating Daily NAV sheet: {str(e)}")
+        return False
 
 
 
@@ -2915,47 +4739,72 @@ def batch_update_balance_sheet(credentials_file, sheet_url, balance_updates):
         print(f"Error updating Balance Sheet: {str(e)}")
 
 
-def batch_update_balance_sheet_with_rate_limiting(rate_limited_client, url, updates_data):
-    """Batch update balance sheet with rate limiting."""
+def batch_update_balance_sheet_with_rate_limiting(rate_limited_client, url, updates_data, snapshot=None,
+                                                  write_buffer=None):
+    """Batch update balance sheet with rate limiting.
+    
+    If a SpreadsheetSnapshot is given, the balance sheet is read from it instead of the API.
+    If a SheetWriteBuffer is given, writes are queued on it and the caller flushes them.
+    Returns True on success, False on error.
+    """
     try:
         # Open the spreadsheet
         spreadsheet = rate_limited_client.open_by_url(url)
         
         # Get or create balance sheet (4th sheet)
-        try:
-            balance_sheet = spreadsheet.get_worksheet(3)  # 0-indexed, so 3 is the 4th sheet
-            if not balance_sheet:
-                balance_sheet = spreadsheet.add_worksheet(title="Balance Sheet", rows=1000, cols=20)
-        except:
-            balance_sheet = spreadsheet.add_worksheet(title="Balance Sheet", rows=1000, cols=20)
+        if snapshot is not None and snapshot.has(3):
+            balance_sheet = snapshot.worksheet(3)  # 0-indexed, so 3 is the 4th sheet
+        else:
+            try:
+                balance_sheet = rate_limited_client.get_worksheet(spreadsheet, 3)
+                if not balance_sheet:
+                    balance_sheet = rate_limited_client.add_worksheet(spreadsheet, "Balance Sheet", rows=1000, cols=20)
+            except:
+                balance_sheet = rate_limited_client.add_worksheet(spreadsheet, "Balance Sheet", rows=1000, cols=20)
+            if snapshot is not None:
+                snapshot.add_tab(balance_sheet)
             
+        buffer = write_buffer if write_buffer is not None else SheetWriteBuffer(spreadsheet)
+        
         # Define headers for balance sheet
         balance_headers = [
             'Date', 'Time', 'Ticker', 'Position', 'Price', 'Market Value', 'Cash', 'NAV'
         ]
         
         # Check if headers exist
-        balance_values = balance_sheet.get_all_values()
+        if snapshot is not None:
+            balance_values = snapshot.values(balance_sheet.title)
+        else:
+            balance_values = balance_sheet.get_all_values()
         header_row = balance_values[0] if balance_values else []
         
+        # Rows are allocated locally from the current sheet length instead of append_row + re-read
+        next_row = len(balance_values) + 1
+        
         if not balance_values or len(header_row) < len(balance_headers):
-            balance_sheet.append_row(balance_headers)
-            time.sleep(1.2)  # Add delay after header creation
+            buffer.add_row(balance_sheet, next_row, balance_headers)
+            next_row += 1
             header_row = balance_headers
             balance_values = [header_row]
             
         # Find column indices
-        date_col = next((i for i, val in enumerate(header_row) if val.lower() == 'date'), 0)
-        time_col = next((i for i, val in enumerate(header_row) if val.lower() == 'time'), 1)
-        ticker_col = next((i for i, val in enumerate(header_row) if val.lower() == 'ticker'), 2)
-        position_col = next((i for i, val in enumerate(header_row) if val.lower() == 'position'), 3)
-        price_col = next((i for i, val in enumerate(header_row) if val.lower() == 'price'), 4)
+        columns = {}
+        for i, name in enumerate(header_row):
+            columns.setdefault(str(name).strip().lower(), i)  # First match wins, as before
+        date_col = columns.get('date', 0)
+        time_col = columns.get('time', 1)
+        ticker_col = columns.get('ticker', 2)
+        position_col = columns.get('position', 3)
+        price_col = columns.get('price', 4)
         mkt_value_col = next((i for i, val in enumerate(header_row) if 'market value' in val.lower() or 'mkt value' in val.lower()), 5)
-        cash_col = next((i for i, val in enumerate(header_row) if val.lower() == 'cash'), 6)
-        nav_col = next((i for i, val in enumerate(header_row) if val.lower() == 'nav'), 7)
+        cash_col = columns.get('cash', 6)
+        nav_col = columns.get('nav', 7)
         
-        # Prepare batch updates
-        batch_updates = []
+        # Build the (date, ticker) -> row lookup once for all updates
+        if snapshot is not None and balance_values is snapshot.values(balance_sheet.title):
+            row_lookup = snapshot.row_index(balance_sheet.title, date_col, ticker_col)
+        else:
+            row_lookup = SheetRowIndex(balance_values, date_col, ticker_col)
         
         # Process each update
         for update in updates_data:
@@ -2968,17 +4817,8 @@ def batch_update_balance_sheet_with_rate_limiting(rate_limited_client, url, upda
             cash = update['cash']
             nav = update['nav']
             
-            # Standardize date for comparison
-            std_date = standardize_date_format(date)
-            
             # Find row with matching date and ticker
-            row_index = None
-            for i, row in enumerate(balance_values[1:], start=2):  # Start at row 2 (1-indexed)
-                if len(row) > max(date_col, ticker_col):
-                    sheet_date = standardize_date_format(row[date_col])
-                    if sheet_date == std_date and row[ticker_col] == ticker:
-                        row_index = i
-                        break
+            row_index = row_lookup.find(date, ticker)
                         
             # If no row exists, create a new row for this ticker (including liquidated ones)
             if not row_index:
@@ -2988,15 +4828,13 @@ def batch_update_balance_sheet_with_rate_limiting(rate_limited_client, url, upda
                 new_row[time_col] = timestamp
                 new_row[ticker_col] = ticker
                 
-                # Append the new row
-                balance_sheet.append_row(new_row)
-                time.sleep(1.2)  # Add delay to avoid rate limits
+                # Write the new row in the same batch as the other updates
+                row_index = next_row
+                next_row += 1
+                row_lookup.add(date, ticker, row_index)
+                buffer.add_row(balance_sheet, row_index, new_row)
                 
-                # Get updated values to find the new row index
-                balance_values = balance_sheet.get_all_values()
-                row_index = len(balance_values)  # The new row is at the end
-                
-            # Create batch updates
+            # Queue the cell updates
             updates_to_make = [
                 {'col': position_col, 'value': position},
                 {'col': price_col, 'value': trade_price},
@@ -3006,28 +4844,23 @@ def batch_update_balance_sheet_with_rate_limiting(rate_limited_client, url, upda
             ]
             
             for update_item in updates_to_make:
-                col = update_item['col']
-                value = update_item['value']
-                a1_notation = gspread.utils.rowcol_to_a1(row_index, col+1)  # +1 because gspread is 1-indexed
-                
-                batch_updates.append({
-                    'range': a1_notation,
-                    'values': [[value]]
-                })
-                
-        # Execute updates in batches
-        if batch_updates:
-            for i in range(0, len(batch_updates), 10):  # Process in batches of 10
-                batch_chunk = batch_updates[i:i+10]
-                retry_with_backoff(balance_sheet.batch_update, batch_chunk)
-                time.sleep(1.2)  # Add delay between batches
+                # +1 because gspread is 1-indexed
+                buffer.add_cell(balance_sheet, row_index, update_item['col'] + 1, update_item['value'])
                 
-            print(f"Updated {len(updates_data)} records in balance sheet")
+        # Send everything in one batchUpdate unless the caller is coalescing writes
+        if updates_data:
+            if write_buffer is None:
+                buffer.flush()
+                print(f"Updated {len(updates_data)} records in balance sheet")
+            else:
+                print(f"Queued {len(updates_data)} balance sheet records")
         else:
             print("No balance sheet updates to perform")
+        return True
             
     except Exception as e:
         print(f"Error updating balance sheet: {str(e)}")
+        return False
 
 
 
@@ -3206,7 +5039,7 @@ def get_previous_nav(db_handler, rate_limited_client, sheet_url):
         spreadsheet = rate_limited_client.open_by_url(sheet_url)
         # Get the Daily NAV sheet (3rd sheet)
         try:
-            nav_sheet = spreadsheet.get_worksheet(2)
+            nav_sheet = rate_limited_client.get_worksheet(spreadsheet, 2)
             if nav_sheet is None:
                 return 100000  # Default if sheet doesn't exist
         except:
@@ -3257,18 +5090,23 @@ def update_first_input_sheet_after_20min(rate_limited_client, sheet_url, trade_r
 
 
 
-def update_portfolio_balance_tab_with_rate_limiting(rate_limited_client, detail_sheet_url, summary_data):
-    """Update the portfolio balance tab with rate limiting."""
+def update_portfolio_balance_tab_with_rate_limiting(rate_limited_client, detail_sheet_url, summary_data,
+                                                    write_buffer=None):
+    """Update the portfolio balance tab with rate limiting.
+    
+    If a SheetWriteBuffer is given, rows are queued on it and the caller flushes them.
+    Returns True once the rows are written (or queued), False on error.
+    """
     try:
         # Open the detail spreadsheet
         spreadsheet = rate_limited_client.open_by_url(detail_sheet_url)
         
         # Try to get the "Portfolio Balance" tab, or create it if it doesn't exist
         try:
-            balance_worksheet = spreadsheet.worksheet("Portfolio Balance")
+            balance_worksheet = rate_limited_client.worksheet(spreadsheet, "Portfolio Balance")
         except:
             # Create the tab
-            balance_worksheet = spreadsheet.add_worksheet(title="Portfolio Balance", rows=1000, cols=10)
+            balance_worksheet = rate_limited_client.add_worksheet(spreadsheet, "Portfolio Balance", rows=1000, cols=10)
             
         # Define headers with the requested changes
         headers = [
@@ -3276,27 +5114,25 @@ def update_portfolio_balance_tab_with_rate_limiting(rate_limited_client, detail_
             'MKT Value', 'Daily P/L', 'Cash', 'NAV'
         ]
         
+        buffer = write_buffer if write_buffer is not None else SheetWriteBuffer(spreadsheet)
+        
         # Check if headers exist, if not add them
         all_values = balance_worksheet.get_all_values()
         if not all_values or len(all_values[0]) != len(headers):
             # If worksheet is empty or headers don't match, set headers
             if all_values:
-                balance_worksheet.clear()  # Clear existing data if headers don't match
+                # Blank the old data in the same batch as the rewrite, so a failed write can't leave the tab empty
+                buffer.clear_range(balance_worksheet, len(all_values), max(len(row) for row in all_values))
                 
-            header_update = {
-                'range': 'A1:I1',
-                'values': [headers]
-            }
-            
-            retry_with_backoff(balance_worksheet.batch_update, [header_update])
-            time.sleep(1.2)  # Add delay to avoid rate limits
+            buffer.add_row(balance_worksheet, 1, headers)
+            all_values = [headers]  # Data rows start right below the new header
             
         # Get current date and timestamp
         current_date = summary_data['date']
         current_timestamp = summary_data['timestamp']
         
-        # Prepare batch updates
-        batch_updates = []
+        # Queue one row per position
+        rows_added = 0
         current_row = len(all_values) + 1
         
         # Add updated position data
@@ -3311,47 +5147,38 @@ def update_portfolio_balance_tab_with_rate_limiting(rate_limited_client, detail_
             # Get Daily P/L
             daily_pl = position['daily_pl']
             
-            row_data = {
-                'range': f'A{current_row}:I{current_row}',
-                'values': [[
-                    current_date,
-                    current_timestamp,
-                    ticker,
-                    shares,
-                    price,
-                    mkt_value,
-                    daily_pl,
-                    summary_data['cash'] if position == summary_data['positions'][0] else "",  # Only show in first row
-                    summary_data['nav'] if position == summary_data['positions'][0] else ""  # Only show in first row
-                ]]
-            }
-            
-            batch_updates.append(row_data)
+            buffer.add_row(balance_worksheet, current_row, [
+                current_date,
+                current_timestamp,
+                ticker,
+                shares,
+                price,
+                mkt_value,
+                daily_pl,
+                summary_data['cash'] if position == summary_data['positions'][0] else "",  # Only show in first row
+                summary_data['nav'] if position == summary_data['positions'][0] else ""  # Only show in first row
+            ])
+            rows_added += 1
             current_row += 1
             
         # If no positions, add a row with just the date, timestamp, cash and NAV
         if not summary_data['positions']:
-            row_data = {
-                'range': f'A{current_row}:I{current_row}',
-                'values': [[
-                    current_date,
-                    current_timestamp,
-                    "", "", "", "", "",
-                    summary_data['cash'],
-                    summary_data['nav']
-                ]]
-            }
-            
-            batch_updates.append(row_data)
+            buffer.add_row(balance_worksheet, current_row, [
+                current_date,
+                current_timestamp,
+                "", "", "", "", "",
+                summary_data['cash'],
+                summary_data['nav']
+            ])
+            rows_added += 1
             
-        # Execute batch update in smaller chunks
-        if batch_updates:
-            for i in range(0, len(batch_updates), 10):  # Reduced batch size
-                batch_chunk = batch_updates[i:i+10]
-                retry_with_backoff(balance_worksheet.batch_update, batch_chunk)
-                time.sleep(1.2)  # Add delay between batches
-                
-            print(f"Updated portfolio balance tab with {len(summary_data['positions'])} positions")
+        # Send everything in one batchUpdate unless the caller is coalescing writes
+        if rows_added:
+            if write_buffer is None:
+                buffer.flush()
+                print(f"Updated portfolio balance tab with {len(summary_data['positions'])} positions")
+            else:
+                print(f"Queued portfolio balance tab update with {len(summary_data['positions'])} positions")
             return True
         else:
             print("No portfolio balance updates to perform")
@@ -3361,6 +5188,123 @@ def update_portfolio_balance_tab_with_rate_limiting(rate_limited_client, detail_
         print(f"Error updating portfolio balance tab: {str(e)}")
         return False
 
+# Runs jobs from the scheduled_jobs table; work survives restarts because the queue lives in SQLite
+class JobScheduler:
+    def __init__(self, db_handler, handlers, retry_delay_seconds=60):
+        self.db_handler = db_handler
+        self.handlers = handlers  # job_type -> callable(payload)
+        self.retry_delay_seconds = retry_delay_seconds
+        requeued = db_handler.requeue_interrupted_jobs()
+        if requeued:
+            print(f"Requeued {requeued} interrupted job(s)")
+
+    def run_due_jobs(self):
+        """Run every job that is due now; returns the number run"""
+        jobs = self.db_handler.claim_due_jobs()
+        for job in jobs:
+            handler = self.handlers.get(job['job_type'])
+            print(f"Running job {job['job_key']} (attempt {job['attempts'] + 1}/{job['max_attempts']})")
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler for job type {job['job_type']}")
+                handler(job['payload'])
+                self.db_handler.complete_job(job['id'])
+            except Exception as e:
+                print(f"Job {job['job_key']} failed: {str(e)}")
+                # Exponential backoff between attempts
+                self.db_handler.fail_job(job['id'], e, self.retry_delay_seconds * 2 ** job['attempts'])
+        return len(jobs)
+
+    def run_worker(self, poll_interval=30, stop_when_idle=True):
+        """Run jobs as they come due; with stop_when_idle, return as soon as nothing is due now
+        (jobs due later, including retries in backoff, are left for the next run)"""
+        while True:
+            ran = self.run_due_jobs()
+            if stop_when_idle and not ran:
+                return
+            next_run = self.db_handler.next_job_time()
+            if next_run is None:
+                time.sleep(poll_interval)
+                continue
+            wait = (next_run - datetime.datetime.now(pytz.utc)).total_seconds()
+            if wait > 0:
+                time.sleep(min(wait, poll_interval))
+                
+    def run_until_empty(self, poll_interval=30):
+        """Run jobs as they come due, waiting for later ones and retries in backoff, until none is pending"""
+        while True:
+            self.run_due_jobs()
+            next_run = self.db_handler.next_job_time()
+            if next_run is None:
+                return
+            wait = (next_run - datetime.datetime.now(pytz.utc)).total_seconds()
+            if wait > 0:
+                time.sleep(min(wait, poll_interval))
+
+
+# The post-trade update runs as a chain of jobs, one per sheet: each strategy sheet in turn, then
+# Combined Metrics, then the balance tab. A step queues the next only once it has succeeded, so a
+# retry re-runs just the failed step and never re-appends rows another step already wrote.
+def enqueue_update_job(db_handler, job_type, payload, run_at=None):
+    job_key = f"{job_type}:{payload['current_date']}"
+    if job_type == 'input_sheets':
+        job_key += f":{payload.get('strategy_idx', 0)}"
+    return db_handler.enqueue_job(job_key, job_type, payload, run_at or datetime.datetime.now(pytz.utc))
+
+
+def run_input_sheets_job(payload, app, rate_limited_client, db_handler):
+    """Post-trade update of one strategy sheet (Trade Details, first tab, balance, Daily NAV) and its cash"""
+    strategy_idx = payload.get('strategy_idx', 0)
+    print(f"Starting delayed update of strategy sheet {strategy_idx + 1}...")
+    individual_sheet_data = payload['individual_sheet_data']
+    
+    # Positions were saved after the trades, so reload them rather than keeping trackers in memory
+    individual_trackers = [PositionTracker(storage_file, ledger=db_handler) for storage_file in payload['individual_tracker_files']]
+    
+    # The strategy's cash snapshot is committed only if its sheet update succeeds.
+    # Failures raise so JobScheduler records them and retries the job with backoff
+    with db_handler.unit_of_work():
+        ticker_abs_shares_all = calculate_ticker_abs_shares_all(individual_sheet_data)
+        if not update_input_sheets_with_rate_limiting(
+            rate_limited_client,
+            payload['strategy_sheet_urls'],
+            payload['trade_results'],
+            payload['ticker_strategy_map'],
+            individual_sheet_data,
+            individual_trackers,
+            db_handler,
+            ticker_abs_shares_all,
+            strategy_indices=[strategy_idx]
+        ):
+            raise RuntimeError(f"Strategy sheet {strategy_idx + 1} update failed")
+            
+    if strategy_idx + 1 < len(payload['strategy_sheet_urls']):
+        enqueue_update_job(db_handler, 'input_sheets', dict(payload, strategy_idx=strategy_idx + 1))
+    else:
+        enqueue_update_job(db_handler, 'combined_metrics', payload)
+
+
+def run_combined_metrics_job(payload, app, rate_limited_client, db_handler):
+    """Post-trade Combined Metrics row, after every strategy sheet (and its cash) is updated"""
+    individual_trackers = [PositionTracker(storage_file, ledger=db_handler) for storage_file in payload['individual_tracker_files']]
+    if not update_combined_metrics_sheet(rate_limited_client, payload['strategy_sheet_urls'], app, individual_trackers, db_handler):
+        raise RuntimeError("Combined Metrics update failed")
+    enqueue_update_job(db_handler, 'balance_tab', payload)
+
+
+def run_balance_tab_job(payload, app, rate_limited_client, db_handler):
+    """Post-trade portfolio summary on the balance tab; the last step of the delayed update"""
+    combined_tracker = PositionTracker(payload['combined_tracker_file'], ledger=db_handler)
+    portfolio_summary = generate_portfolio_summary(app, combined_tracker, payload['trade_results'], payload['current_date'])
+    if not update_portfolio_balance_tab_with_rate_limiting(rate_limited_client, payload['detail_sheet_url'], portfolio_summary):
+        raise RuntimeError("Portfolio balance tab update failed")
+    print("Delayed full update complete.")
+
+
+# `--simulated` reads the strategy sheets from CSV fixtures here instead of Google Sheets (see local_sheets.py)
+SIMULATION_FIXTURES_DIR = os.path.join('fixtures', 'simulation')
+
+
 def run_loop(app):
     """Run the TWS client connection"""
     app.run()
@@ -3387,7 +5331,8 @@ def connect(self):
 
 
 
-def main():
+def main(run_jobs_only=False, simulated=False, use_async=False, prewarm_only=False,
+         fixtures_dir=SIMULATION_FIXTURES_DIR):
     # --- Configuration ---
     credentials_file = 'credentials_IBKR.json'
     strategy_sheet_urls = [
@@ -3398,13 +5343,19 @@ def main():
     output_sheet_url = 'https://docs.google.com/spreadsheets/d/1xWE7ajeuxSG8ItMoeEo9xblJ3QDC1HLPsZ2H1GHLTvo/edit?gid=0#gid=0'
     detail_sheet_url = 'https://docs.google.com/spreadsheets/d/1rNq1lKYoGnZemMrIe73_hwgqRPrlmNgD6jQThvjvXZ4/edit?gid=0#gid=0'
 
-    db_handler = DatabaseHandler('trading_data.db')
-    rate_limited_client = RateLimitedClient(credentials_file, max_calls_per_minute=50)
-    combined_tracker = PositionTracker('combined_positions.json')
+    # --simulated trades against SimulatedBroker with its own database and position files, reads the
+    # strategy sheets from local CSV fixtures and writes no sheets (fully offline, no credentials)
+    storage_prefix = 'sim_' if simulated else ''
+    db_handler = DatabaseHandler(storage_prefix + 'trading_data.db')
+    if simulated:
+        rate_limited_client, simulated_prices = load_simulation_fixtures(fixtures_dir, strategy_sheet_urls)
+    else:
+        rate_limited_client = RateLimitedClient(credentials_file, max_calls_per_minute=50)
+    combined_tracker = PositionTracker(storage_prefix + 'combined_positions.json', ledger=db_handler)
     individual_trackers = [
-        PositionTracker('strategy1_positions.json'),
-        PositionTracker('strategy2_positions.json'),
-        PositionTracker('strategy3_positions.json')
+        PositionTracker(storage_prefix + 'strategy1_positions.json', ledger=db_handler),
+        PositionTracker(storage_prefix + 'strategy2_positions.json', ledger=db_handler),
+        PositionTracker(storage_prefix + 'strategy3_positions.json', ledger=db_handler)
     ]
 
     # Ensure position files are properly loaded
@@ -3419,13 +5370,16 @@ def main():
     # api_thread = threading.Thread(target=run_loop, args=(app,), daemon=True)
     # api_thread.start()
 
-    app = IBKRClientWrapper()
-    if not app.connect():
-        print("Failed to connect to IBKR. Exiting.")
-        return
+    if simulated:
+        app = SimulatedBroker(prices=simulated_prices)
+    else:
+        app = IBKRClientWrapper(conid_store=db_handler)
+        if not app.connect():
+            print("Failed to connect to IBKR. Exiting.")
+            return
 
     app.request_account_summary()
-    time.sleep(3)  # Wait for account data
+    app.wait_for_account_summary(timeout=3)  # Wait for account data
 
     # Get current positions
     positions = app.get_positions()
@@ -3454,7 +5408,32 @@ def main():
 
     # Request account summary
     app.request_account_summary()
-    time.sleep(3)  # Wait for account data
+    app.wait_for_account_summary(timeout=3)  # Wait for account data
+
+    # Catch up on delayed work left by an earlier run (e.g. the process exited before it was due).
+    # 'full_update' jobs queued before the update was split into steps start the chain
+    job_handlers = {
+        'input_sheets': run_input_sheets_job,
+        'full_update': run_input_sheets_job,
+        'combined_metrics': run_combined_metrics_job,
+        'balance_tab': run_balance_tab_job
+    }
+    scheduler = JobScheduler(db_handler, {
+        job_type: partial(handler, app=app, rate_limited_client=rate_limited_client, db_handler=db_handler)
+        for job_type, handler in job_handlers.items()
+    })
+    scheduler.run_worker()
+    if run_jobs_only:
+        app.disconnect()
+        return
+        
+    # Resolve contract ids for held positions while the strategy sheets are read, so only
+    # tickers that are new today are looked up after that
+    prewarm_thread = None
+    if not simulated:
+        prewarm_thread = threading.Thread(target=app.prewarm_conids, args=(list(combined_tracker.positions),),
+                                          daemon=True)
+        prewarm_thread.start()
 
     # Combine positions from strategy sheets
     # combined_data, individual_sheet_data, ticker_strategy_map = combine_positions_from_sheets(
@@ -3478,14 +5457,24 @@ def main():
     eastern = pytz.timezone('US/Eastern')
     current_date = datetime.datetime.now(eastern).strftime("%Y-%m-%d")
     add_liquidation_rows_to_individual_data(individual_trackers, individual_sheet_data, current_date)
+    
+    # Look up contract ids before placement so each order is a single call. `--prewarm-conids`
+    # run from cron ahead of the trading window fills the trading_data.db cache and exits
+    if prewarm_thread is not None:
+        prewarm_thread.join()
+        app.prewarm_conids([trade['Ticker'] for trade in combined_data] + list(combined_tracker.positions))
+    if prewarm_only:
+        app.disconnect()
+        return
 
 
     # Connect to Google Sheets using rate-limited client
     output_worksheet = None
     detail_worksheet = None
     try:
-        output_worksheet = rate_limited_client.open_by_url(output_sheet_url).sheet1
-        detail_worksheet = rate_limited_client.open_by_url(detail_sheet_url).sheet1
+        if not simulated:
+            output_worksheet = rate_limited_client.get_worksheet(rate_limited_client.open_by_url(output_sheet_url), 0)
+            detail_worksheet = rate_limited_client.get_worksheet(rate_limited_client.open_by_url(detail_sheet_url), 0)
     except Exception as e:
         print(f"Error connecting to sheets: {str(e)}")
 
@@ -3495,16 +5484,30 @@ def main():
         eastern = pytz.timezone('US/Eastern')
         current_date = datetime.datetime.now(eastern).strftime("%Y-%m-%d")
 
-        # Execute all orders first
-        orders_info = execute_all_orders(app, combined_data, combined_tracker, current_date, individual_trackers)
-
-        # Retrieve order details after delay (20 minutes)
-        results, trade_results = retrieve_order_details(
-            app, orders_info, combined_tracker,
-            individual_trackers, individual_sheet_data,
-            ticker_strategy_map, db_handler,
-            output_worksheet
-        )
+        if use_async:
+            # Placement and fill waiting run as coroutines on one event loop
+            engine = AsyncExecutionEngine(app)
+            try:
+                results, trade_results = asyncio.run(engine.execute(
+                    combined_data, combined_tracker, current_date, individual_trackers,
+                    individual_sheet_data, ticker_strategy_map, db_handler, output_worksheet,
+                    detail_worksheet
+                ))
+            finally:
+                engine.close()
+            # The engine already exported today's trades to the detail worksheet
+            detail_worksheet = None
+        else:
+            # Execute all orders first
+            orders_info = execute_all_orders(app, combined_data, combined_tracker, current_date, individual_trackers)
+
+            # Retrieve order details after delay (20 minutes)
+            results, trade_results = retrieve_order_details(
+                app, orders_info, combined_tracker,
+                individual_trackers, individual_sheet_data,
+                ticker_strategy_map, db_handler,
+                output_worksheet
+            )
 
         # Save positions for all trackers
         combined_tracker.save_positions()
@@ -3544,39 +5547,41 @@ def main():
             else:
                 print("No updates for first input sheet after 20 minutes.")
 
+        if simulated:
+            print(f"Simulated run: processed {len(results)} trades, positions saved under '{storage_prefix}*'")
+            return
+
         update_first_input_sheet_after_20min()
 
         # --- Schedule the rest of the updates (all sheets, NAV, etc.) after 1 hour ---
-        def delayed_full_update():
-            print("Starting delayed full update (all sheets, NAV, etc.) after 1 hour...")
-            ticker_abs_shares_all = calculate_ticker_abs_shares_all(individual_sheet_data)
-            update_input_sheets_with_rate_limiting(
-                rate_limited_client,
-                strategy_sheet_urls,
-                trade_results,
-                ticker_strategy_map,
-                individual_sheet_data,
-                individual_trackers,
-                db_handler,
-                ticker_abs_shares_all
-            )
-            # After trade execution and updating individual sheets
-            update_combined_metrics_sheet(rate_limited_client, strategy_sheet_urls, app, individual_trackers, db_handler)
-
-            # Update portfolio summary and balance tab
-            eastern = pytz.timezone('US/Eastern')
-            current_date = datetime.datetime.now(eastern).strftime("%Y-%m-%d")
-            portfolio_summary = generate_portfolio_summary(app, combined_tracker, trade_results, current_date)
-            update_portfolio_balance_tab_with_rate_limiting(rate_limited_client, detail_sheet_url, portfolio_summary)
-            print("Delayed full update complete.")
-
-        timer = threading.Timer(60 * 60, delayed_full_update)
-        timer.start()
-        print("Scheduled full sheet/NAV update for 1 hour later.")
+        # Queue the update chain in trading_data.db instead of a threading.Timer, so each step runs
+        # once (idempotent per day), is retried on failure and survives a restart
+        full_update_delay = 60 * 60
+        enqueue_update_job(
+            db_handler,
+            'input_sheets',
+            {
+                'current_date': current_date,
+                'strategy_sheet_urls': strategy_sheet_urls,
+                'detail_sheet_url': detail_sheet_url,
+                'trade_results': trade_results,
+                'individual_sheet_data': individual_sheet_data,
+                'ticker_strategy_map': ticker_strategy_map,
+                'individual_tracker_files': [tracker.storage_file for tracker in individual_trackers],
+                'combined_tracker_file': combined_tracker.storage_file,
+                'strategy_idx': 0
+            },
+            datetime.datetime.now(pytz.utc) + datetime.timedelta(seconds=full_update_delay)
+        )
+        print(f"Scheduled full sheet/NAV update for {full_update_delay // 60} minutes later.")
 
         print(f"Processed {len(results)} trades")
         print(f"Saved combined positions: {combined_tracker.positions}")
-        print("Updated first sheet. Remaining sheets/NAV will update after 1 hour.")
+        
+        # Stay connected until the update chain is done, retries included. If the process is
+        # stopped first, the next run (or `--run-jobs`, e.g. from cron) picks the jobs up
+        print("Updated first sheet. Waiting to run the remaining sheets/NAV updates...")
+        scheduler.run_until_empty()
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
@@ -3585,5 +5590,8 @@ def main():
         app.disconnect()
 
 if __name__ == "__main__":
-    main()
+    fixtures_arg = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--fixtures=')), None)
+    main(run_jobs_only="--run-jobs" in sys.argv, simulated="--simulated" in sys.argv,
+         fixtures_dir=fixtures_arg or SIMULATION_FIXTURES_DIR,
+         use_async="--async" in sys.argv, prewarm_only="--prewarm-conids" in sys.argv)
 
@@ -4,8 +4,9 @@ import datetime
 import pytz
 import smtplib
 import sqlite3
+import pathlib
 import threading
-import random
+import asyncio
 import os
 import sys
 import logging
@@ -13,6 +14,7 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
+from contextlib import contextmanager
 from oauth2client.service_account import ServiceAccountCredentials
 
 # Set up logging
@@ -27,11 +29,25 @@ logging.basicConfig(
 
 logger = logging.getLogger("strategy_monitor")
 
+# Applied in order, once per database, after the tables exist; each entry is (name, list of SQL statements).
+# trading_data.db is shared with order_exec, so names carry a monitor_ prefix in the same schema_migrations table
+SCHEMA_MIGRATIONS = [
+    ('monitor_001_nav_tracking_strategy_date_index', [
+        # Latest NAV per strategy is read with ORDER BY date DESC LIMIT 1
+        "CREATE INDEX IF NOT EXISTS idx_nav_tracking_strategy_date "
+        "ON strategy_nav_tracking(strategy_idx, date DESC)",
+    ]),
+]
+
 # Database Handler class
 class DatabaseHandler:
     def __init__(self, db_file='trading_data.db'):
         self.db_file = db_file
         self.conn = None
+        # One writer (self.conn, guarded by self.lock) plus a read-only connection per thread
+        self._readers = threading.local()
+        self._readers_lock = threading.Lock()
+        self._reader_connections = []
         self.create_connection()
         self.lock = threading.Lock()
         
@@ -50,6 +66,47 @@ class DatabaseHandler:
             logger.info(f"Connected to SQLite database {self.db_file}")
         except sqlite3.Error as e:
             logger.error(f"Error connecting to database: {e}")
+            
+    @contextmanager
+    def read_cursor(self):
+        """Cursor for queries on this thread's read-only connection, so reads don't queue behind self.lock
+        
+        With WAL, readers see the last committed state while the single writer (self.conn) is busy.
+        In-memory databases can't be shared between connections and fall back to the locked writer.
+        """
+        conn = self._read_connection()
+        if conn is None:
+            with self.lock:
+                yield self.conn.cursor()
+        else:
+            yield conn.cursor()
+            
+    def _read_connection(self):
+        conn = getattr(self._readers, 'conn', None)
+        if conn is not None or self.db_file == ':memory:':
+            return conn
+        try:
+            conn = sqlite3.connect(pathlib.Path(self.db_file).resolve().as_uri() + '?mode=ro', uri=True,
+                                   check_same_thread=False, timeout=30.0)
+        except sqlite3.Error as e:
+            logger.error(f"Error opening read-only connection, using the writer: {e}")
+            return None
+        self._readers.conn = conn
+        with self._readers_lock:
+            self._reader_connections.append(conn)
+        return conn
+        
+    def close(self):
+        """Close the writer and every thread's read-only connection"""
+        with self._readers_lock:
+            for conn in self._reader_connections:
+                conn.close()
+            self._reader_connections = []
+        self._readers = threading.local()
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
 
     def create_strategy_config_table(self):
         """Create a table to store strategy configurations"""
@@ -123,6 +180,39 @@ class DatabaseHandler:
             cursor.execute(nav_tracking_table)
             self.conn.commit()
             logger.info("Created strategy_nav_tracking table if it didn't exist")
+            
+    def apply_migrations(self):
+        """Apply any SCHEMA_MIGRATIONS not yet recorded in schema_migrations; call once the tables exist"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    name TEXT PRIMARY KEY,
+                    applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+                );
+                """)
+                cursor.execute("SELECT name FROM schema_migrations")
+                applied = {row[0] for row in cursor.fetchall()}
+                self.conn.commit()
+                
+                for name, statements in SCHEMA_MIGRATIONS:
+                    if name in applied:
+                        continue
+                    try:
+                        for statement in statements:
+                            cursor.execute(statement)
+                        cursor.execute("INSERT INTO schema_migrations (name) VALUES (?)", (name,))
+                        self.conn.commit()
+                        logger.info(f"Applied migration {name}")
+                    except sqlite3.Error as e:
+                        self.conn.rollback()
+                        logger.error(f"Error applying migration {name}: {e}")
+                        return False
+                return True
+            except sqlite3.Error as e:
+                logger.error(f"Error applying migrations: {e}")
+                return False
 
     
 
@@ -156,8 +246,7 @@ class DatabaseHandler:
 
     def get_strategy_status_changes(self):
         """Get strategies that have been marked inactive but not yet processed"""
-        with self.lock:
-            cursor = self.conn.cursor()
+        with self.read_cursor() as cursor:
             cursor.execute("""
                 SELECT sc.strategy_idx, sc.strategy_name, sc.initial_nav, sc.sheet_url, sei.owner_email
                 FROM strategy_config sc
@@ -189,7 +278,7 @@ class DatabaseHandler:
                 
     def get_previous_day_cash(self, strategy_idx):
         """Get the most recent cash value for a strategy"""
-        with self.lock:
+        with self.read_cursor() as cursor:
             sql = """
             SELECT cash FROM strategy_cash 
             WHERE strategy_idx = ? 
@@ -198,7 +287,6 @@ class DatabaseHandler:
             """
             
             try:
-                cursor = self.conn.cursor()
                 cursor.execute(sql, (strategy_idx,))
                 result = cursor.fetchone()
                 return result[0] if result else None
@@ -225,37 +313,87 @@ class DatabaseHandler:
             logger.warning(f"Could not convert date format: {date_str}")
             return date_str
 
+# Token bucket used to pace Google Sheets API calls
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0  # tokens added per second
+        self.capacity = float(burst if burst is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.last_refill = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if they are available right now; never blocks"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def reserve(self, tokens=1):
+        """
+        Reserve tokens and return how many seconds the caller must wait before using them.
+        The balance may go negative, so callers queue up in order without holding the lock.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until the tokens are available (sleeps outside the lock)"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        """Awaitable version of acquire for use on an asyncio event loop"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
 # Enhanced rate limiting for Google Sheets API
 class RateLimitedClient:
-    def __init__(self, credentials_file, max_calls_per_minute=60):
+    def __init__(self, credentials_file, max_calls_per_minute=60, reads_per_minute=None,
+                 writes_per_minute=None, burst=10):
         scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
         creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_file, scope)
         self.client = gspread.authorize(creds)
         self.max_calls_per_minute = max_calls_per_minute
-        self.call_timestamps = []
-        self.lock = threading.Lock()
 
-    def _wait_if_needed(self):
-        """Wait if we're approaching the rate limit"""
-        with self.lock:
-            now = time.time()
-            # Remove timestamps older than 60 seconds
-            self.call_timestamps = [ts for ts in self.call_timestamps if now - ts < 60]
-            # If we're at the limit, wait until we can make another call
-            if len(self.call_timestamps) >= self.max_calls_per_minute:
-                oldest = min(self.call_timestamps)
-                sleep_time = 61 - (now - oldest)
-                if sleep_time > 0:
-                    logger.info(f"Rate limit approaching. Waiting {sleep_time:.2f} seconds...")
-                    time.sleep(sleep_time)
-                # After waiting, update now and clean timestamps again
-                now = time.time()
-                self.call_timestamps = [ts for ts in self.call_timestamps if now - ts < 60]
-            # Add current timestamp
-            self.call_timestamps.append(now)
-            # Add jitter to avoid synchronization problems
-            jitter = random.uniform(0.1, 0.5)
-            time.sleep(jitter)
+        # Google meters read and write requests against separate per-minute quotas
+        self.buckets = {
+            'read': TokenBucket(reads_per_minute or max_calls_per_minute, burst),
+            'write': TokenBucket(writes_per_minute or max_calls_per_minute, burst)
+        }
+
+    def _wait_if_needed(self, kind='read'):
+        """Wait until the read or write quota bucket has room for another call"""
+        wait = self.buckets[kind].reserve()
+        if wait > 1:
+            logger.info(f"Rate limit approaching. Waiting {wait:.2f} seconds for {kind} quota...")
+        if wait > 0:
+            time.sleep(wait)
+
+    def try_acquire(self, kind='read'):
+        """Non-blocking check: take a quota slot if one is free right now"""
+        return self.buckets[kind].try_acquire()
+
+    async def acquire_async(self, kind='read'):
+        """Awaitable quota acquisition for asyncio callers"""
+        await self.buckets[kind].acquire_async()
 
     def open_by_url(self, url):
         """Open a spreadsheet by URL with rate limiting"""
@@ -329,8 +467,7 @@ def create_strategy_nav_tracking_table(db_handler):
 
 def check_available_nav_capacity(db_handler):
     """Check how much of the total NAV capacity is still available"""
-    with db_handler.lock:
-        cursor = db_handler.conn.cursor()
+    with db_handler.read_cursor() as cursor:
         cursor.execute("""
             SELECT SUM(initial_nav) FROM strategy_config WHERE active = 1
         """)
@@ -882,8 +1019,7 @@ def add_strategy(db_handler, strategy_name, sheet_url, initial_cash=100000, init
 
 def get_strategy_current_nav(db_handler, strategy_name):
     """Get current NAV for a strategy"""
-    with db_handler.lock:
-        cursor = db_handler.conn.cursor()
+    with db_handler.read_cursor() as cursor:
         cursor.execute("""
             SELECT snt.current_nav 
             FROM strategy_nav_tracking snt
@@ -897,8 +1033,7 @@ def get_strategy_current_nav(db_handler, strategy_name):
     
 def get_strategy_status_changes(db_handler):
     """Get strategies that have been marked inactive but not yet processed"""
-    with db_handler.lock:
-        cursor = db_handler.conn.cursor()
+    with db_handler.read_cursor() as cursor:
         cursor.execute("""
             SELECT sc.strategy_idx, sc.strategy_name, sc.initial_nav, sc.sheet_url, sei.owner_email
             FROM strategy_config sc
@@ -1223,8 +1358,7 @@ def update_strategy_setup_summary(rate_limited_client, setup_sheet_url, db_handl
         setup_sheet = spreadsheet.worksheet("Strategy Setup")
         
         # Calculate summary values
-        with db_handler.lock:
-            cursor = db_handler.conn.cursor()
+        with db_handler.read_cursor() as cursor:
             
             # Active NAV (sum of initial NAVs of active strategies)
             cursor.execute("SELECT SUM(initial_nav) FROM strategy_config WHERE active = 1")
@@ -2489,6 +2623,7 @@ def check_once():
     db_handler.create_extended_strategy_config_table()
     db_handler.create_strategy_cash_table()
     db_handler.create_strategy_nav_tracking_table()
+    db_handler.apply_migrations()
     
     # Connect to Google Sheets with rate limiting
     credentials_file = "credentials_IBKR.json"
@@ -2554,6 +2689,7 @@ def run_continuous_monitoring():
     db_handler.create_extended_strategy_config_table()
     db_handler.create_strategy_cash_table()
     create_strategy_nav_tracking_table(db_handler)
+    db_handler.apply_migrations()
     
     # Connect to Google Sheets with rate limiting
     credentials_file = "credentials_IBKR.json"
@@ -0,0 +1,73 @@
+"""
+PositionTracker with a DatabaseHandler ledger: in-memory positions must match position_events
+whether the unit of work commits or not.
+
+Run from the repository root:
+    python -m pytest -q tests
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+for module in ('gspread', 'yfinance', 'pytz', 'numpy', 'oauth2client'):
+    pytest.importorskip(module)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import order_exec_v11 as oe
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    handler = oe.DatabaseHandler(str(tmp_path / 'trading_data.db'))
+    yield handler
+    handler.close()
+
+
+@pytest.fixture
+def tracker(tmp_path, ledger):
+    return oe.PositionTracker(str(tmp_path / 'positions.json'), ledger=ledger)
+
+
+def assert_tracker_matches_db(tracker, ledger):
+    stored = ledger.load_positions(tracker.storage_file) or {}
+    assert tracker.positions == stored
+    for ticker in set(stored) | {'AAPL', 'MSFT'}:
+        assert tracker.get_position(ticker) == stored.get(ticker, 0)
+
+
+def test_commit_applies_changes(tracker, ledger):
+    with ledger.unit_of_work():
+        tracker.update_position('AAPL', 10, '2024-03-07')
+        tracker.update_position('MSFT', -5, '2024-03-07')
+        assert tracker.get_position('AAPL') == 10
+        assert tracker.positions == {}
+
+    assert tracker.positions == {'AAPL': 10, 'MSFT': -5}
+    assert_tracker_matches_db(tracker, ledger)
+
+
+def test_failed_commit_leaves_tracker_matching_db(tracker, ledger):
+    tracker.update_position('AAPL', 10, '2024-03-06')
+
+    with pytest.raises(sqlite3.Error):
+        with ledger.unit_of_work():
+            tracker.update_position('AAPL', 5, '2024-03-07')
+            tracker.update_position('MSFT', 3, '2024-03-07')
+            # Malformed row: the whole transaction, position events included, fails at commit
+            ledger.insert_trade(['2024-03-07', 'AAPL'])
+
+    assert tracker.positions == {'AAPL': 10}
+    assert_tracker_matches_db(tracker, ledger)
+
+
+def test_exception_in_unit_discards_staged_changes(tracker, ledger):
+    with pytest.raises(ValueError):
+        with ledger.unit_of_work():
+            tracker.update_position('AAPL', 10, '2024-03-07')
+            raise ValueError("order rejected")
+
+    assert tracker.get_position('AAPL') == 0
+    assert_tracker_matches_db(tracker, ledger)